@@ -1,11 +1,17 @@
 import sys
 import os
 import csv
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from compressed_io import decompressed_path, SUFFIXES
 
 '''
 
   Script to convert the maxSAT comp 23 problems into SAT and UNSAT KNF formulas (one SAT and one UNSAT for each known bound that is not 1 or len(soft units) -1)
 
+  The benchmarks can be left compressed as distributed (.wcnf.xz), they are inflated into a temporary directory for the converter
+
 '''
 def get_formula_data (file) :
   data = {}
@@ -18,6 +24,13 @@ def get_formula_data (file) :
       candidates.append(temp_b)
   return candidates, data
 
+# the benchmark file, plain or with a compression suffix
+def find_wcnf (in_file):
+  for suffix in [""] + list(SUFFIXES):
+    if os.path.exists(in_file + suffix):
+      return in_file + suffix
+  return in_file
+
 def convertmax2knf():
 
   candidates, formula_data = get_formula_data ("data/maxSAT_formula_info.csv")
@@ -34,16 +47,19 @@ def convertmax2knf():
     bound = (int(formula_data[b]['SoftUnits']) - int(formula_data[b]['UnsatBound']) ) + 1
 
     converter = "maxSAT_to_KNF/maxSAT2KNF"
-    in_file = f"mse23-exact-unweighted-benchmarks/{b}.wcnf"
+    in_file = find_wcnf (f"mse23-exact-unweighted-benchmarks/{b}.wcnf")
     ofile_sat = f"benchmarks/{b}-sat.knf"
     ofile_unsat = f"benchmarks/{b}-unsat.knf"
     
     sys.stdout.flush()
-    # write the SAT formula
-    os.system (f"{converter} {in_file} -MaxSAT2KNF {ofile_sat} -add_bound {bound}")
+    with tempfile.TemporaryDirectory() as work_dir:
+      plain_file = decompressed_path (in_file, work_dir)
+
+      # write the SAT formula
+      os.system (f"{converter} {plain_file} -MaxSAT2KNF {ofile_sat} -add_bound {bound}")
 
-    # write the UNSAT formula with a modified bound
-    os.system (f"{converter} {in_file} -MaxSAT2KNF {ofile_unsat} -add_bound {bound-1}")
+      # write the UNSAT formula with a modified bound
+      os.system (f"{converter} {plain_file} -MaxSAT2KNF {ofile_unsat} -add_bound {bound-1}")
 
     
 #######################################################################################
@@ -2,8 +2,6 @@
 
 formula=$1
 
-# argument -z to print coverage
-for sorting in occurence proximity natural graph; do
-  echo "\n\nVariable ordering then Coverage for "$sorting"\n"
-  python3 tools/order_and_encode.py -k $formula -v $sorting -z
-done
+# coverage of every ordering from one parse of the formula,
+# printed as tikz plots (add -f json or -f csv for machine-readable output)
+python3 tools/coverage.py -k $formula -v occurence,proximity,natural,graph
@@ -13,17 +13,26 @@ timeout=1800
 
 TMP=tmp
 
+# orderings are cached across runs, the -sat/-unsat pair of a benchmark share an entry
+ORDCACHE=$TMP/ordering_cache
+
 mkdir -p $TMP
 
+# unique per-job workspace for the CNF and solver output, removed when the job ends
+# so several jobs can run in the same directory
+WORK=$(mktemp -d "$TMP/job.XXXXXX")
+trap 'rm -rf "$WORK"' EXIT
+trap 'exit 1' INT TERM
+
 
 if [ $ordering == "natural+PAMO" ]; then 
   # run natural for 100 seconds then PAMO
-  timeout 100s sh scripts/run_preproc_and_solve.sh $formula natural $encoding > $TMP/orig.out
+  timeout 100s sh scripts/run_preproc_and_solve.sh $formula natural $encoding > $WORK/orig.out
 
-  if grep -q "satisfiable" $TMP/orig.out; then
-    cat $TMP/orig.out
-  elif grep -q "unsatisfiable" $TMP/orig.out; then
-    cat $TMP/orig.out
+  if grep -q "satisfiable" $WORK/orig.out; then
+    cat $WORK/orig.out
+  elif grep -q "unsatisfiable" $WORK/orig.out; then
+    cat $WORK/orig.out
   else 
     # solver returns unknown
     # try proximity for remaining 1700seconds
@@ -36,16 +45,16 @@ else
 
   # run preprocessor
   echo "\nRun Preprocessor"
-  time timeout $timeout"s" python3 $PREPROC -k $formula -e $encoding -v $ordering -c $TMP/$outcnf -q $TMP/temp.ord
+  time timeout $timeout"s" python3 $PREPROC -k $formula -e $encoding -v $ordering -c $WORK/$outcnf -d $ORDCACHE
 
   # run solver
   echo "\nRun Solver"
-  time timeout $timeout"s" ./$CADICAL $TMP/$outcnf > $TMP/cadical.out
+  time timeout $timeout"s" ./$CADICAL $WORK/$outcnf > $WORK/cadical.out
 
   # print solver result
-  if grep -Fxq "s SATISFIABLE" $TMP/cadical.out; then
+  if grep -Fxq "s SATISFIABLE" $WORK/cadical.out; then
     echo "\nSolver returns satisfiable"
-  elif grep -Fxq "s UNSATISFIABLE" $TMP/cadical.out; then
+  elif grep -Fxq "s UNSATISFIABLE" $WORK/cadical.out; then
     echo "\nSolver returns unsatisfiable"
   else 
     echo "\nSolver returns unknown"
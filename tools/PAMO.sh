@@ -3,14 +3,23 @@
 INPUTKNF=$1
 OUTPUTORD=$2
 
-CNF2KNF="tools/AMO_detection/amo_detect"
-PROX="tools/proximity/proximity"
+# binaries are found relative to this script, not the working directory
+TOOLS=$(dirname "$0")
+CNF2KNF="$TOOLS/AMO_detection/amo_detect"
+PROX="$TOOLS/proximity/proximity"
 
- ./$CNF2KNF --Quick_Write=true --Direct_AMO_Small=false -Direct_timeout 25 -Encoded_timeout 25 $INPUTKNF > temp.amo
+# unique per-job workspace, removed on exit so parallel jobs do not collide
+WORK=$(mktemp -d "${TMPDIR:-/tmp}/pamo.XXXXXX")
+trap 'rm -rf "$WORK"' EXIT
+trap 'exit 1' INT TERM
 
- cat $INPUTKNF temp.amo > temp.knf
+ $CNF2KNF --Quick_Write=true --Direct_AMO_Small=false -Direct_timeout 25 -Encoded_timeout 25 $INPUTKNF > $WORK/temp.amo
 
- ./$PROX temp.knf > $OUTPUTORD
-
- rm temp.amo temp.knf
+ cat $INPUTKNF $WORK/temp.amo > $WORK/temp.knf
 
+ # print the ordering to stdout when no output file is given
+ if [ -z "$OUTPUTORD" ]; then
+   $PROX $WORK/temp.knf
+ else
+   $PROX $WORK/temp.knf > $OUTPUTORD
+ fi
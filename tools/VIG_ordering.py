@@ -1,19 +1,23 @@
 import argparse
+import multiprocessing
 import os
-from collections import defaultdict
 from time import time
-from typing import List
 import networkx as nx
+import numpy as np
+from knf import parse_knf, CARD
+from vig import build_vig, clause_occurrences, neighbourhood, induced_subgraph, cache_key, load_vig, save_vig, load_partitions, save_partitions
+from compressed_io import open_output
 # from tqdm import tqdm
-# import pickle
 
 
 '''
 This script parses a KNF formula and returns a variable ordering by
 
   1. Parsing the KNF
-  2. Creating the variable incidence graph (VIG)
-  3. Running community detection up to 50 times or until the timeout is reached
+  2. Creating the variable incidence graph (VIG), in CSR form (vig.py)
+  3. Running community detection up to 50 times or until the timeout is reached,
+     the seeds run in parallel (-j) and can stop early (-p), optionally on the
+     neighbourhood of the soft variables only (-n)
   4. Selecting a variable ordering from the best community
   5. Prints the ordeirng
 
@@ -27,15 +31,24 @@ Note on modules,
 
   networkx module is included in the supplementary materials
 
-  pickle allows uploading and downloading graphs, 
-  currently commented out to avoid any package issues 
-  during reproducibility checks.
+  the KNF input and the output file may be compressed (.xz, .gz, .bz2, .zst),
+  see compressed_io.py
+
+  --graph and --community store/load the graph and the Louvain result as
+  versioned .npz files (see vig.py), --cache-dir names them by formula hash.
+  They are reused for any formula with the same clauses (the bound is ignored)
+  and the same graph and Louvain parameters, otherwise recomputed and overwritten.
 
   tqdm allows pretty time bars, again commented out to 
   avoid package issues.
 '''
 
 
+# Louvain seeds run in parallel, every worker touches the graph (refcounts), so
+# its pages are copied per worker and the memory grows with the number of jobs
+GRAPH_JOBS = min(4, os.cpu_count() or 1)
+
+
 def vprint(*args, verbose=True, **kwargs):
     if verbose:
         print(*args, **kwargs)
@@ -78,12 +91,17 @@ def parse_arguments():
     parser.add_argument(
         "-c",
         "--community",
-        help="Pilckle file that store/load community result",
+        help="NPZ file that store/load community result",
     )
     parser.add_argument(
         "-g",
         "--graph",
-        help="Pilckle file that store/load graph",
+        help="NPZ file that store/load graph",
+    )
+    parser.add_argument(
+        "-r",
+        "--cache-dir",
+        help="Directory of graph and community files named by formula hash",
     )
     parser.add_argument(
         "-s",
@@ -97,12 +115,58 @@ def parse_arguments():
         action="store_true",
         help="Allow multiple same edges",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=GRAPH_JOBS,
+        help="Number of processes running Louvain seeds in parallel (default: at most 4)",
+    )
+    parser.add_argument(
+        "-p",
+        "--patience",
+        type=int,
+        default=None,
+        help="Stop after this many seeds without more communities or a lower group deviation",
+    )
+    parser.add_argument(
+        "-k",
+        "--max-clique",
+        type=int,
+        default=None,
+        help="Replace the clique of clauses longer than this by a star around a hub node",
+    )
+    parser.add_argument(
+        "-e",
+        "--decay",
+        action="store_true",
+        help="Weight clique edges by 1/(k-1) for clauses of length k",
+    )
+    parser.add_argument(
+        "-n",
+        "--soft-hops",
+        type=int,
+        default=None,
+        help="Only cluster the soft variables and their neighbours up to this many hops",
+    )
+    parser.add_argument(
+        "-x",
+        "--project",
+        action="store_true",
+        help="With --soft-hops, keep the removed neighbours as boundary nodes connecting the kept ones",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
         action="store_true",
         help="Print out more information",
     )
+    parser.add_argument(
+        "-a",
+        "--all-constraints",
+        action="store_true",
+        help="Print the variable order of every cardinality constraint (one per line), not only the first",
+    )
     parser.add_argument(
         "-z",
         "--only_order",
@@ -112,129 +176,255 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def main(
-    knf,
-    sort_variables,
-    weight,
-    descending,
-    output_file,
-    iteration,
-    timeout,
-    only_order,
-    verbose=False,
-    graph_file=None,
-    community_file=None,
-    multi=False,
-):
-    clauses: List[List] = []
-    _clauses: List[List] = []
-    clauses_for_community_finding = []
-    cardinality_constraint_bounds = []
-    cardinality_constraints = []
-    # DICT = defaultdict(list)
-    info = ""
-    var_occ_cnts = {}
+# Graph shared with the Louvain worker processes. The pool is forked where
+# fork is available (the default start method may be spawn or forkserver),
+# then the workers read the graph copy-on-write instead of receiving a copy.
+# Elsewhere the initializer pickles it to every worker. The workers record
+# the start time of every seed in a shared array.
+shared = {}
+
+
+def share_graph(G, started=None):
+    shared["graph"] = G
+    shared["started"] = started
 
+
+def pool_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def seed_communities(seed):
+    communities = nx.community.louvain_communities(shared["graph"], seed=seed)
+    return sorted(map(sorted, communities))
+
+
+def pool_seed_communities(indexed_seed):
+    index, seed = indexed_seed
+    shared["started"][index] = time()
+    return seed_communities(seed)
+
+
+# seconds between two checks of the timeout and the deadline while a pool seed runs
+POLL_INTERVAL = 0.1
+
+
+def seed_jobs(jobs):
     '''
-    1. Parse the KNF formula
+    Number of processes running the Louvain seeds, 1 inside a pool worker
+    (daemon processes cannot start a pool)
+    '''
+    if multiprocessing.current_process().daemon:
+        return 1
+    return max(1, jobs)
+
 
-    - parse the clauses, with _clauses containing variables (absolute value of literals)
-    - skip the cardinality constraints, not used in VIG, and only used if printing entire formula
+def seed_results(G, seeds, timeout, jobs, deadline=None):
     '''
+    Louvain partitions of the seeds, yielded in seed order.
+    With jobs > 1 the seeds run in a process pool, the pool is stopped when the
+    caller stops consuming (timeout or early stop). Inside a pool worker (batch
+    or coverage runs, daemon processes cannot start a pool) the seeds run one
+    after another whatever jobs is.
+
+    As when the seeds run one after another, a seed that started before the
+    timeout is kept and the first seed is always kept. Past the deadline (a
+    time() value) no more seeds are yielded, not even those still running.
+    '''
+    start = time()
+
+    def timed_out(num_done, started):
+        return num_done > 0 and started - start > timeout
+
+    def past_deadline(num_done):
+        return deadline is not None and num_done > 0 and time() > deadline
+
+    shared["graph"] = G
+    try:
+        # pool workers (batch or coverage runs) cannot start their own pool
+        if seed_jobs(jobs) > 1 and len(seeds) > 1:
+            context = pool_context()
+            # start time of every seed, 0 until it starts
+            started = context.RawArray("d", len(seeds))
+            with context.Pool(min(jobs, len(seeds)), initializer=share_graph, initargs=(G, started)) as pool:
+                results = pool.imap(pool_seed_communities, enumerate(seeds))
+                for num_done in range(len(seeds)):
+                    while True:
+                        try:
+                            communities = results.next(POLL_INTERVAL)
+                            break
+                        except multiprocessing.TimeoutError:
+                            # do not wait for a seed that started after the timeout (0: not started yet)
+                            if past_deadline(num_done) or timed_out(num_done, started[num_done] or time()):
+                                return
+                    if past_deadline(num_done) or timed_out(num_done, started[num_done]):
+                        return
+                    yield communities
+        else:
+            for num_done, seed in enumerate(seeds):
+                # exit if we hit a timeout
+                if timed_out(num_done, time()) or past_deadline(num_done):
+                    return
+                yield seed_communities(seed)
+    finally:
+        shared.clear()
 
-    vprint("=== read file ===", verbose=verbose)
-    with open(knf, "r") as input_file:
-        cardinality_constraint_indexes = []
-
-        info = input_file.readline()
-        _, _, total_num_vars, _ = info.split()
-        total_num_vars = int(total_num_vars)
-
-        lines = input_file.readlines()
-        for i in range(len(lines)):
-            vars = lines[i].split()
-            if vars[0] == "k":
-                cardinality_constraint_indexes.append(i)
-                continue
-            clause = []
-            _clause = []
-            for j in range(len(vars) - 1):
-                clause.append(int(vars[j]))
-                _clause.append(abs(int(vars[j])))
-                if  abs(int(vars[j])) not in var_occ_cnts:
-                  var_occ_cnts [abs(int(vars[j]))] = 1
-                else:
-                  var_occ_cnts [abs(int(vars[j]))] += 1
-            clauses.append(clause)
-            _clauses.append(_clause)
-
-        cardinality_constraints = [
-            [0 for _ in range(total_num_vars)]
-            for _ in range(len(cardinality_constraint_indexes))
-        ]
-        for i in range(len(cardinality_constraint_indexes)):
-            vars = lines[cardinality_constraint_indexes[i]].split()
-            cardinality_constraint_bounds.append(int(vars[1]))
-            for j in range(2, len(vars) - 1):
-                if int(vars[j]) > 0:
-                    cardinality_constraints[i][int(vars[j]) - 1] += 1
-                elif int(vars[j]) < 0:
-                    cardinality_constraints[i][(-int(vars[j])) - 1] -= 1
+
+def group_deviation(communities, num_vars):
     '''
-    2. Create the VIG
+    Sum of the distances of the group sizes to the ideal size num_vars / groups
     '''
-    if graph_file is not None and os.path.exists(graph_file):
-        vprint("=== load graph ===", verbose=verbose)
-        # with open(graph_file, "rb") as fp:
-        #     G = pickle.load(fp)
-    else:
-        if multi:
-            G = nx.MultiGraph()
+    ideal_group_size = num_vars // len(communities)
+    return sum(abs(len(group) - ideal_group_size) for group in communities)
+
+
+def louvain_seeds(G, iteration=50, timeout=300.0, jobs=1, patience=None, verbose=False, deadline=None, num_vars=None):
+    '''
+    Partitions with the most communities over the seeds 0..iteration-1
+    (seeded with the iteration index for reproducibility), and whether the
+    search was cut by the deadline.
+
+    The results are consumed in seed order whatever the number of jobs, so the
+    partitions only depend on the seeds. With patience, the search stops once
+    that many seeds in a row neither increased the number of communities nor
+    lowered the group deviation (over num_vars variables) at that number.
+    Past the timeout or the deadline, the partitions of the seeds run so far
+    are returned. The timeout is part of the configuration (how many seeds
+    start before it depends on the number of jobs), only the deadline cuts
+    the search.
+    '''
+    if num_vars is None:
+        num_vars = G.number_of_nodes()
+
+    best_communities = []
+    max_num_communities = 0
+    min_deviation = None
+    since_improvement = 0
+    num_done = 0
+
+    for seed, communities in enumerate(seed_results(G, list(range(iteration)), timeout, jobs, deadline)):
+        num_done += 1
+        deviation = group_deviation(communities, num_vars)
+        if len(communities) > max_num_communities:
+            max_num_communities = len(communities)
+            best_communities.clear()
+            best_communities.append(communities)
+            min_deviation = deviation
+            since_improvement = 0
+        elif len(communities) == max_num_communities and deviation < min_deviation:
+            best_communities.append(communities)
+            min_deviation = deviation
+            since_improvement = 0
         else:
-            G = nx.Graph()
+            if len(communities) == max_num_communities:
+                best_communities.append(communities)
+            since_improvement += 1
+
+        if patience is not None and since_improvement >= patience:
+            vprint(f"=== stop after seed {seed}, no improvement for {patience} seeds ===", verbose=verbose)
+            return best_communities, False
 
-        # NOTE: each variable is a node
-        G.add_nodes_from(range(1, total_num_vars + 1))
+    return best_communities, num_done < iteration and deadline is not None and time() > deadline
 
-        # NOTE: any two variables that in a same clause has an edge
-        vprint("=== add edges ===", verbose=verbose)
-        # PERF: improve performance for generating graph
-        from itertools import combinations
 
-        for c in _clauses:
-            G.add_edges_from(combinations(c, 2))
+class PartialGroups(list):
+    '''
+    Community groups of a Louvain search cut by the deadline
+    '''
+    pass
+
+
+def community_groups(
+    formula,
+    sort_variables=False,
+    iteration=50,
+    timeout=300.0,
+    verbose=False,
+    graph_file=None,
+    community_file=None,
+    multi=False,
+    jobs=1,
+    patience=None,
+    max_clique=None,
+    decay=False,
+    cache_dir=None,
+    soft_hops=None,
+    project=False,
+    deadline=None,
+):
+    total_num_vars = formula.max_var
+
+    '''
+    1. Count the occurrences of the variables in the clauses of the parsed KNF formula
 
-        # if graph_file is not None:
-        #     with open(graph_file, "wb") as fp:
-        #         pickle.dump(G, fp)
+    - skip the cardinality constraints, not used in VIG
+    '''
+    var_occ_cnts = clause_occurrences(formula)
+
+    # keys of the graph and community files, the bound is ignored
+    graph_params = dict(max_clique=max_clique, decay=decay)
+    graph_key = cache_key(formula, "graph", **graph_params)
+    # the seeds that start before the timeout depend on the processes running them
+    community_key = cache_key(formula, "louvain", multi=multi, iteration=iteration, timeout=timeout, jobs=seed_jobs(jobs),
+                              patience=patience, soft_hops=soft_hops, project=project, **graph_params)
+    if cache_dir is not None:
+        graph_file = graph_file or os.path.join(cache_dir, graph_key + ".vig.npz")
+        community_file = community_file or os.path.join(cache_dir, community_key + ".louvain.npz")
 
     '''
-    3. Detect communities
+    3. Detect communities (or load them, then the graph is not needed)
     '''
-    if community_file is not None and os.path.exists(community_file):
+    best_communities = load_partitions(community_file, community_key)
+    cut = False
+    if best_communities is not None:
         vprint("=== load louvain community ===", verbose=verbose)
-        # with open(community_file, "rb") as fp:
-        #     best_communities = pickle.load(fp)
     else:
-        best_communities = []
-        max_num_communities = 0
+        '''
+        2. Create the VIG (CSR arrays built from the flat literal array, see vig.py)
+        '''
+        vig = load_vig(graph_file, graph_key)
+        if vig is not None:
+            vprint("=== load graph ===", verbose=verbose)
+        else:
+            # NOTE: each variable is a node, any two variables that in a same clause has an edge
+            vprint("=== add edges ===", verbose=verbose)
+            vig = build_vig(formula, max_clique, decay)
+            if graph_file is not None:
+                save_vig(vig, graph_file, graph_key)
+
+        # variables kept in the communities, not the hub nodes of the long clauses
+        members = np.zeros(vig.num_nodes + 1, dtype=bool)
+        members[1:total_num_vars + 1] = True
+
+        if soft_hops is not None:
+            # only cluster the soft variables and their neighbourhood
+            vprint(f"=== restrict to {soft_hops}-hop neighbourhood of the soft variables ===", verbose=verbose)
+            members &= neighbourhood(vig, formula.soft_units(), soft_hops)
+            vig = induced_subgraph(vig, members, project)
+
+        # with multi, parallel edges are merged into the edge weight
+        G = vig.to_networkx(weighted=multi or decay)
+        # the CSR arrays are not needed any more, free them before Louvain runs
+        num_nodes = vig.num_nodes
+        del vig
+
         vprint("=== Calculate Louvain Community ===", verbose=verbose)
-        start = time()
-        for i in range(iteration):
-            # exit if we hit a timeout
-            if (time() - start) > timeout:
-                break
-            # Seed with loop iteration index for reproducibility
-            communities = nx.community.louvain_communities(G, seed=i)
-            if len(communities) > max_num_communities:
-                max_num_communities = len(communities)
-                best_communities.clear()
-                best_communities.append(sorted(map(sorted, communities)))
-            elif len(communities) == max_num_communities:
-                best_communities.append(sorted(map(sorted, communities)))
-        # if community_file is not None:
-        #     with open(community_file, "wb") as fp:
-        #         pickle.dump(best_communities, fp)
+        best_communities, cut = louvain_seeds(G, iteration, timeout, jobs, patience, verbose, deadline, total_num_vars)
+        if len(best_communities) == 0:
+            raise ValueError("Louvain community detection returned no partition")
+
+        if max_clique is not None or soft_hops is not None:
+            # drop the hub and boundary nodes, they are not ordered, and sort the
+            # groups again as load_partitions does, so cached runs pick the same group
+            best_communities = [
+                sorted(group for group in ([v for v in group if members[v]] for group in communities) if group)
+                for communities in best_communities
+            ]
+
+        # seeds cut by the deadline are not stored, the next run can do them all
+        if community_file is not None and not cut:
+            save_partitions(best_communities, num_nodes, community_file, community_key)
 
     # with open('best', 'w') as f:
     #     f.write(f'{best_communities = }')
@@ -244,36 +434,119 @@ def main(
     4. Select a variable ordering from the best community
     '''
     best_group = []
-    ideal_group_size = total_num_vars // len(best_communities[0])
     min_deviation = 99999999999
 
     for i in range(len(best_communities)):
-        current_deviation = 0
-        for group in best_communities[i]:
-            current_deviation += abs(len(group) - ideal_group_size)
+        current_deviation = group_deviation(best_communities[i], total_num_vars)
         if current_deviation < min_deviation:
             best_group = best_communities[i].copy()
 
     new_best = []
     if sort_variables:
-      print("Sorting")
+      vprint("Sorting", verbose=verbose)
       for group in best_group:
         new_best.append((sorted(group, key=lambda x: var_occ_cnts[x],reverse=True)))
 
       best_group = new_best
 
+    if cut:
+        return PartialGroups(best_group)
+    return best_group
+
+
+def community_positions(formula, best_group):
+    '''
+    Position of every variable in the community order (groups one after the
+    other), -1 for the variables outside of the groups
+    '''
+    order = np.fromiter((v for group in best_group for v in group), dtype=np.int64)
+    position = np.full(formula.max_var + 1, -1, dtype=np.int64)
+    position[order] = np.arange(len(order))
+    return position
+
+
+def cardinality_literals(formula, best_group):
+    '''
+    Literals of every cardinality constraint ordered by the community groups,
+    a literal appears as many times as in the constraint
+
+    Each constraint keeps a sparse map variable -> multiplicity (positive and
+    negative occurrences cancel out), its variables are put in community order
+    by sorting their positions, so a constraint costs O(k log k) for k literals
+    instead of a pass over all the variables.
+    '''
+    position = community_positions(formula, best_group)
+
+    constraints = []
+    for index in formula.indices(CARD):
+        lits = np.asarray(formula.literals(index), dtype=np.int64)
+        variables, inverse = np.unique(np.abs(lits), return_inverse=True)
+        multiplicity = np.bincount(inverse.ravel(), weights=np.sign(lits), minlength=len(variables)).astype(np.int64)
+
+        # members of the constraint, filtered and sorted through the community order
+        keep = (multiplicity != 0) & (position[variables] >= 0)
+        variables, multiplicity = variables[keep], multiplicity[keep]
+        in_order = np.argsort(position[variables], kind='stable')
+        variables, multiplicity = variables[in_order], multiplicity[in_order]
+
+        signed = np.where(multiplicity > 0, variables, -variables)
+        constraints.append(np.repeat(signed, np.abs(multiplicity)).tolist())
+
+    return constraints
+
+
+def main(
+    knf,
+    sort_variables,
+    weight,
+    descending,
+    output_file,
+    iteration,
+    timeout,
+    only_order,
+    verbose=False,
+    graph_file=None,
+    community_file=None,
+    multi=False,
+    jobs=1,
+    patience=None,
+    max_clique=None,
+    decay=False,
+    cache_dir=None,
+    all_constraints=False,
+    soft_hops=None,
+    project=False,
+):
+    vprint("=== read file ===", verbose=verbose)
+    formula = parse_knf(knf)
+    info = f"p knf {formula.max_var} {formula.num_cls}\n"
+
+    best_group = community_groups(
+        formula,
+        sort_variables,
+        iteration,
+        timeout,
+        verbose,
+        graph_file,
+        community_file,
+        multi,
+        jobs,
+        patience,
+        max_clique,
+        decay,
+        cache_dir,
+        soft_hops,
+        project,
+    )
+
     # print(best_group)
     '''
     5. Write the ordering to a file (or print out the formula with reordered cardinality constraints)
     '''
+    cardinality_constraint_bounds = [formula.bounds[i] for i in formula.indices(CARD)]
     k_constraints = []
-    for index in range(len(cardinality_constraints)):
-        literals = (
-            str(i * (1 if cardinality_constraints[index][i - 1] > 0 else -1))
-            for group in best_group
-            for i in group
-            for _ in range(abs(cardinality_constraints[index][i - 1]))
-        )
+    for index, ordered in enumerate(cardinality_literals(formula, best_group)):
+        literals = (str(lit) for lit in ordered)
         if only_order:
           k_constraints.append(
               f'{" ".join(literals)}'
@@ -283,25 +556,27 @@ def main(
               f'k {cardinality_constraint_bounds[index]} {" ".join(literals)} 0\n'
           )
 
+    # one ordering line per cardinality constraint, or only the first one
+    orders = k_constraints if all_constraints else k_constraints[:1]
+
     if output_file is not None:
         if only_order:
-          with open(output_file, "w") as f:
+          with open_output(output_file) as f:
               f.write(
-                  "".join(k_constraints[0] + " \n"
-                  )
+                  "".join(order + " \n" for order in orders)
               )
         else:
-          with open(output_file, "w") as f:
+          with open_output(output_file) as f:
               f.write(
                   "".join(
                       [info]
-                      + [line for line in lines if not line.startswith("k")]
+                      + [formula.line(i) for i in range(len(formula)) if formula.kinds[i] != CARD]
                       + k_constraints
                   )
               )
     else:
       if only_order:
-        print("".join(k_constraints[0] + " \n"))
+        print("".join(order + " \n" for order in orders))
       else:
         print("".join(k_constraints))
 
@@ -321,4 +596,12 @@ if __name__ == "__main__":
         args.graph,
         args.community,
         args.multi,
+        args.jobs,
+        args.patience,
+        args.max_clique,
+        args.decay,
+        args.cache_dir,
+        args.all_constraints,
+        args.soft_hops,
+        args.project,
     )
@@ -0,0 +1,214 @@
+import sys
+import getopt
+import hashlib
+import os
+import tempfile
+import time
+from array import array
+from knf import parse_knf, parse_knf_lines, KnfFormula, CLAUSE, AMO
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+This script parses a KNF formula and prints its direct AMO constraints by
+
+  1. Parsing the KNF
+  2. Finding cliques in the binary clauses
+  3. Printing the AMO constraints (m lines)
+
+In-process version of the direct AMO engine of tools/AMO_detection/amo_detect,
+giving the same m lines as amo_detect --Encoded_AMO=false --Direct_AMO_Small=false.
+
+Direct AMO detection,
+
+  A binary clause (-a -b) says at most one of a, b is true. The binary clauses
+  are the edges of a graph over the negated literals, a clique of that graph is
+  an AMO constraint over its literals,
+
+    m <size-1> <literals of the clauses> 0
+
+  Taking the binary clauses in clause order, the clique of each remaining edge
+  (l1,l2) is grown greedily with the neighbours of l1 (in insertion order)
+  adjacent to the whole clique. The edges of the clique are removed, and the
+  clique is emitted when it has at least AMO_MIN_SIZE literals.
+
+Detection stops at an optional deadline (time.time() value) with the cliques
+found so far, the binary stops at its -Direct_timeout the same way.
+
+Detection cache,
+
+  The detected constraints only depend on the binary clauses. They are stored
+  in <cache_dir>/<key>.amo as m lines, the key is a hash of the binary clauses
+  and of AMO_CACHE_VERSION, so the -sat/-unsat pair of a benchmark and reruns
+  on the same hard clauses detect once. A detection that ran past its deadline
+  may be incomplete and is not stored.
+
+Default Exuection:
+
+  > python3 amo_cliques.py -k <KNF> [-t <timeout>] > <AMOs>
+'''
+
+# smaller cliques are not emitted (small_size of the direct engine)
+AMO_MIN_SIZE = 4
+
+# bump when the detection changes its output
+AMO_CACHE_VERSION = 1
+
+# Literals of the binary clauses, clause i is (pairs[2i], pairs[2i+1]), in clause order
+def binary_clauses (formula):
+  if np is not None:
+    lits, offsets, _, kinds = formula.as_numpy()
+    binary = np.flatnonzero((kinds == CLAUSE) & (np.diff(offsets) == 2))
+    first = offsets[binary]
+    pairs = np.stack((lits[first], lits[first+1]), axis=1)
+    return array('i', pairs.astype(np.int32).tobytes())
+
+  pairs = array('i')
+  for i in range(len(formula)):
+    if formula.kinds[i] == CLAUSE and formula.size(i) == 2:
+      pairs.extend(formula.lits[formula.offsets[i]:formula.offsets[i+1]])
+  return pairs
+
+# Direct AMO constraints of the formula as a KnfFormula of AMO constraints
+def detect_amos (formula, deadline=None, min_size=AMO_MIN_SIZE):
+  pairs = binary_clauses (formula)
+
+  # edges between negated literals, keyed (l1,l2) with abs(l1) < abs(l2),
+  # neighbours are kept in insertion order
+  edges = []
+  remaining = {}
+  neighbours = {}
+  for i in range(0, len(pairs), 2):
+    a, b = pairs[i], pairs[i+1]
+    if abs(a) == abs(b): continue
+    l1, l2 = (-a, -b) if abs(a) < abs(b) else (-b, -a)
+    edges.append((l1, l2))
+    remaining[(l1, l2)] = True
+    neighbours.setdefault(l1, {})[l2] = True
+    neighbours.setdefault(l2, {})[l1] = True
+
+  def remove_edge (l1, l2):
+    del remaining[(l1, l2)]
+    del neighbours[l1][l2]
+    del neighbours[l2][l1]
+
+  amos = KnfFormula(formula.max_var)
+  next_edge = 0
+  while remaining:
+    if deadline is not None and time.time() > deadline:
+      break
+
+    # next edge in clause order that is not part of a clique yet
+    edge = edges[next_edge]
+    next_edge += 1
+    while edge not in remaining:
+      edge = edges[next_edge]
+      next_edge += 1
+    (l1, l2) = edge
+
+    # grow the clique with the neighbours of l1
+    clique = {l1, l2}
+    for lit in neighbours[l1]:
+      adjacent = neighbours[lit]
+      if all(c == lit or c in adjacent for c in clique):
+        clique.add(lit)
+    clique = sorted(clique, key=abs)
+
+    if len(clique) < 3:
+      remove_edge (l1, l2)
+      continue
+
+    for i in range(len(clique)):
+      for j in range(i+1, len(clique)):
+        remove_edge (clique[i], clique[j])
+
+    if len(clique) >= min_size:
+      amos.append(AMO, len(clique) - 1, [-lit for lit in clique])
+
+  return amos
+
+def amo_cache_key (formula, min_size=AMO_MIN_SIZE):
+  h = hashlib.sha256()
+  h.update(str(formula.max_var).encode())
+  h.update(memoryview(binary_clauses (formula)).cast('B'))
+  h.update(str(min_size).encode())
+  h.update(str(AMO_CACHE_VERSION).encode())
+  return h.hexdigest()
+
+def amo_cache_path (cache_dir, key):
+  return os.path.join(cache_dir, key + ".amo")
+
+# AMO constraints stored in path, None on a miss
+def load_amos (path, max_var):
+  try:
+    with open(path, 'r') as f:
+      amos = parse_knf_lines(f)
+  except OSError:
+    return None
+  amos.max_var = max_var
+
+  # refresh the entry for the LRU eviction of the ordering cache
+  try:
+    os.utime(path)
+  except OSError:
+    pass
+  return amos
+
+# Write the AMO constraints to path atomically
+def save_amos (amos, path):
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+  with os.fdopen(fd, 'w') as f:
+    for i in range(len(amos)):
+      f.write(amos.line(i))
+  os.chmod(tmp_path, 0o644)
+  os.replace(tmp_path, path)
+
+# Direct AMO constraints, from <cache_dir>/<key>.amo when detected before
+def cached_amos (formula, cache_dir=None, deadline=None, min_size=AMO_MIN_SIZE):
+  if cache_dir is None:
+    return detect_amos (formula, deadline, min_size)
+
+  path = amo_cache_path (cache_dir, amo_cache_key (formula, min_size))
+  amos = load_amos (path, formula.max_var)
+  if amos is None:
+    amos = detect_amos (formula, deadline, min_size)
+    if deadline is None or time.time() <= deadline:
+      save_amos (amos, path)
+  return amos
+
+def generate_amos (knf_input, timeout=None):
+
+  # 1. Parse KNF formula
+  formula = parse_knf (knf_input)
+
+  # 2. Find the cliques
+  deadline = None if timeout is None else time.time() + timeout
+  amos = detect_amos (formula, deadline)
+
+  # 3. Print AMO constraints
+  for i in range(len(amos)):
+    sys.stdout.write(amos.line(i))
+
+
+def run(name, args):
+
+    knf_input = None
+    timeout = None
+
+    optlist, args = getopt.getopt(args, "k:t:")
+    for (opt, val) in optlist:
+        if opt == '-k':
+            knf_input = val
+        elif opt == '-t':
+            timeout = float(val)
+
+    generate_amos (knf_input, timeout)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
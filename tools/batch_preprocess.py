@@ -0,0 +1,145 @@
+import sys
+import os
+import getopt
+import time
+from multiprocessing import Pool
+
+from knf import parse_knf
+from compressed_io import strip_compression
+from orderings import resolve_ordering_type, compute_ordering, check_ordering
+from order_and_encode import write_cnf, check_encoding
+
+
+'''
+Batch preprocessing over many formulas x orderings x encodings.
+
+Each formula is parsed once and each ordering is computed once, then reused
+for every encoding. Formulas are spread over a pool of worker processes.
+
+  1. Collect the formulas (a directory of .knf files, plain or compressed, or a manifest with one path per line)
+  2. For each formula (in parallel): parse, compute every ordering, write every encoding
+  3. Print one CSV line per (formula, ordering, encoding) with the timings
+
+Default Exuection:
+
+  > python3 tools/batch_preprocess.py -k benchmarks -v PAMO+Occur,natural -e kmtotalizer,seqcounter -c tmp/batch -j 8 > times.csv
+
+Output CNFs are written to <output_dir>/<formula>_<encoding>_<ordering>.cnf,
+-d <cache_dir> shares computed orderings with other runs (see ordering_cache.py),
+-x <xz|gz|bz2|zst> compresses the output CNFs.
+'''
+
+ENCODINGS = ["seqcounter", "sortnetwrk", "cardnetwrk", "mtotalizer", "kmtotalizer"]
+
+def collect_formulas (source):
+  if os.path.isdir(source):
+    return sorted(os.path.join(source, f) for f in os.listdir(source) if strip_compression(f).endswith(".knf"))
+
+  # manifest, one formula per line
+  with open(source, 'r') as manifest:
+    return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+def formula_name (knf_input):
+  name = os.path.basename(strip_compression(knf_input))
+  if name.endswith(".knf"):
+    name = name[:-4]
+  return name
+
+# Worker: parse once, order once per ordering, encode once per (ordering, encoding)
+def preprocess_formula (task):
+  knf_input, orderings, encodings, output_dir, cache_dir, compression = task
+  name = formula_name (knf_input)
+  rows = []
+
+  start = time.time()
+  formula = parse_knf (knf_input)
+  parse_time = time.time() - start
+
+  for configuration in orderings:
+    variable_ordering_type, random_seed, occLimit = resolve_ordering_type (configuration)
+
+    start = time.time()
+    var_map = compute_ordering (formula, variable_ordering_type, random_seed, occLimit, cache_dir)
+    order_time = time.time() - start
+
+    for encoding_type in encodings:
+      cnf_output = os.path.join(output_dir, f"{name}_{encoding_type}_{configuration}.cnf")
+      if compression is not None:
+        cnf_output += "." + compression
+
+      start = time.time()
+      write_cnf (formula, var_map, formula.max_var, cnf_output, encoding_type, False)
+      encode_time = time.time() - start
+
+      rows.append([encoding_type, configuration, parse_time, order_time, encode_time, name])
+
+  return rows
+
+def run_batch (formulas, orderings, encodings, output_dir, cache_dir, jobs, compression=None):
+  os.makedirs(output_dir, exist_ok=True)
+  tasks = [(knf_input, orderings, encodings, output_dir, cache_dir, compression) for knf_input in formulas]
+
+  print("Encoding,Configuration,Parse-WALL,Order-WALL,Encode-WALL,Name")
+  with Pool(jobs) as pool:
+    # one formula per task so its parse and orderings are shared by all encodings
+    for rows in pool.imap_unordered(preprocess_formula, tasks, chunksize=1):
+      for row in rows:
+        print(','.join(str(x) for x in row))
+      sys.stdout.flush()
+
+
+def run(name, args):
+
+    source = None
+    orderings = ["PAMO+Occur"]
+    encodings = ENCODINGS
+    output_dir = "tmp"
+    cache_dir = os.environ.get("ORDERING_CACHE_DIR")
+    jobs = os.cpu_count()
+    compression = None
+
+    optlist, args = getopt.getopt(args, "k:v:e:c:d:j:x:")
+    for (opt, val) in optlist:
+        if opt == '-k':
+            source = val
+        elif opt == '-v':
+            orderings = val.split(",")
+        elif opt == '-e':
+            encodings = val.split(",")
+        elif opt == '-c':
+            output_dir = val
+        elif opt == '-d':
+            cache_dir = val
+        elif opt == '-j':
+            jobs = int(val)
+        elif opt == '-x':
+            compression = val
+
+    if source is None:
+      print("Error: batch mode needs a directory or manifest of formulas (-k)")
+      sys.exit(1)
+
+    # unknown names fail here, before any worker starts
+    try:
+      for configuration in orderings:
+        check_ordering (resolve_ordering_type (configuration)[0])
+      for encoding_type in encodings:
+        check_encoding (encoding_type)
+    except ValueError as e:
+      print("Error: " + str(e))
+      sys.exit(1)
+
+    # x.knf and x.knf.gz would write the same output CNFs
+    formulas = collect_formulas (source)
+    names = {}
+    for knf_input in formulas:
+      name = formula_name (knf_input)
+      if name in names:
+        print(f"Error: {names[name]} and {knf_input} have the same name {name}")
+        sys.exit(1)
+      names[name] = knf_input
+
+    run_batch (formulas, orderings, encodings, output_dir, cache_dir, jobs, compression)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
@@ -0,0 +1,52 @@
+from compressed_io import open_output
+
+
+'''
+Streaming writer for CNF/KNF formulas.
+
+Clauses are formatted into a buffer and written in large chunks instead of
+one file.write per clause. The output is compressed when the path ends in
+.xz, .gz, .bz2 or .zst (see compressed_io.py). The header has to be known before the first
+clause, callers compute the number of clauses and the top variable up front
+(the top variable is taken from the encoder, not by rescanning the clauses).
+
+  with CnfWriter(path) as writer:
+    writer.header("cnf", max_var, num_cls)
+    writer.clause([1, -2])
+'''
+
+class CnfWriter:
+
+  def __init__ (self, out_path, chunk_size=1 << 16):
+    self.out_file = open_output(out_path)
+    self.chunk_size = chunk_size  # number of lines buffered before a write
+    self.buffer = []
+
+  def __enter__ (self):
+    return self
+
+  def __exit__ (self, *exc):
+    self.close()
+
+  def header (self, fmt, max_var, num_cls):
+    self.line("p " + fmt + " " + str(max_var) + " " + str(num_cls) + "\n")
+
+  def line (self, text):
+    self.buffer.append(text)
+    if len(self.buffer) >= self.chunk_size:
+      self.flush()
+
+  def clause (self, literals):
+    self.line(' '.join(map(str, literals)) + " 0\n")
+
+  def clauses (self, clauses):
+    for literals in clauses:
+      self.clause(literals)
+
+  def flush (self):
+    self.out_file.write(''.join(self.buffer))
+    self.buffer = []
+
+  def close (self):
+    self.flush()
+    self.out_file.close()
@@ -0,0 +1,234 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import shutil
+import threading
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+'''
+Transparent compressed I/O for formulas, orderings and CNF outputs.
+
+Input files are opened by magic bytes (falling back to the suffix), output
+files by suffix,
+
+  .xz   lzma
+  .gz   gzip
+  .bz2  bzip2
+  .zst  zstandard (optional module)
+
+Compressed streams are decompressed/compressed chunk by chunk on a background
+thread, so the parser (or the encoder) keeps running while the next chunk is
+inflated (or the previous one deflated). The compressors release the GIL while
+working on a chunk. Plain files are opened with a normal buffered open().
+
+  with open_input("formula.knf.xz") as lines:
+    for line in lines: ...
+
+  with open_output("formula.cnf.zst") as out:
+    out.write(...)
+
+External binaries cannot read compressed files, decompressed_path() inflates
+a copy into a workspace directory for them.
+
+Note on modules,
+
+  zstandard is only needed for .zst files
+'''
+
+CHUNK_SIZE = 1 << 20
+
+# chunks in flight between the I/O thread and the caller
+QUEUE_DEPTH = 8
+
+MAGIC = [
+  (b"\xfd7zXZ\x00", "xz"),
+  (b"\x1f\x8b", "gz"),
+  (b"BZh", "bz2"),
+  (b"\x28\xb5\x2f\xfd", "zst"),
+]
+
+SUFFIXES = {".xz": "xz", ".lzma": "xz", ".gz": "gz", ".bz2": "bz2", ".zst": "zst"}
+
+# fast presets, the outputs are intermediate files
+LEVELS = {"xz": 1, "gz": 6, "bz2": 9, "zst": 3}
+
+
+def suffix_compression (path):
+  return SUFFIXES.get(os.path.splitext(str(path))[1])
+
+# compression of an existing file, from its first bytes then its suffix
+def detect_compression (path):
+  try:
+    with open(path, 'rb') as f:
+      head = f.read(6)
+  except OSError:
+    return suffix_compression (path)
+
+  for (magic, kind) in MAGIC:
+    if head.startswith(magic):
+      return kind
+  return None
+
+# strip a compression suffix, "a.knf.xz" -> "a.knf"
+def strip_compression (path):
+  if suffix_compression (path) is not None:
+    return os.path.splitext(path)[0]
+  return path
+
+def need_zstandard ():
+  if zstandard is None:
+    raise ImportError("zstandard is required for .zst files")
+
+def raw_reader (path, kind):
+  if kind == "xz":
+    return lzma.open(path, 'rb')
+  if kind == "gz":
+    return gzip.open(path, 'rb')
+  if kind == "bz2":
+    return bz2.open(path, 'rb')
+  need_zstandard ()
+  return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+def raw_writer (path, kind):
+  if kind == "xz":
+    return lzma.open(path, 'wb', preset=LEVELS["xz"])
+  if kind == "gz":
+    return gzip.open(path, 'wb', compresslevel=LEVELS["gz"])
+  if kind == "bz2":
+    return bz2.open(path, 'wb', compresslevel=LEVELS["bz2"])
+  need_zstandard ()
+  return zstandard.ZstdCompressor(level=LEVELS["zst"]).stream_writer(open(path, 'wb'), closefd=True)
+
+
+# Decompresses on a background thread, the caller reads the inflated chunks
+class ThreadedReader (io.RawIOBase):
+
+  def __init__ (self, raw, chunk_size=CHUNK_SIZE):
+    self.raw = raw
+    self.chunk_size = chunk_size
+    self.chunks = queue.Queue(QUEUE_DEPTH)
+    self.pending = memoryview(b"")
+    self.eof = False
+    self.stopped = False
+    self.thread = threading.Thread(target=self.fill, daemon=True)
+    self.thread.start()
+
+  def fill (self):
+    try:
+      while not self.stopped:
+        chunk = self.raw.read(self.chunk_size)
+        self.chunks.put(chunk)
+        if len(chunk) == 0: break
+    except Exception as e:
+      self.chunks.put(e)
+
+  def readable (self):
+    return True
+
+  def readinto (self, b):
+    while len(self.pending) == 0:
+      if self.eof:
+        return 0
+      chunk = self.chunks.get()
+      if isinstance(chunk, Exception):
+        raise chunk
+      if len(chunk) == 0:
+        self.eof = True
+      self.pending = memoryview(chunk)
+
+    n = min(len(b), len(self.pending))
+    b[:n] = self.pending[:n]
+    self.pending = self.pending[n:]
+    return n
+
+  def close (self):
+    if not self.closed:
+      # unblock the thread if the caller stopped before the end of the file
+      self.stopped = True
+      while self.thread.is_alive():
+        try:
+          self.chunks.get(timeout=0.1)
+        except queue.Empty:
+          pass
+      self.raw.close()
+    super().close()
+
+
+# Compresses on a background thread, the caller only queues the chunks
+class ThreadedWriter (io.RawIOBase):
+
+  def __init__ (self, raw):
+    self.raw = raw
+    self.chunks = queue.Queue(QUEUE_DEPTH)
+    self.error = None
+    self.thread = threading.Thread(target=self.drain, daemon=True)
+    self.thread.start()
+
+  def drain (self):
+    while True:
+      chunk = self.chunks.get()
+      if chunk is None: break
+      if self.error is not None: continue
+      try:
+        self.raw.write(chunk)
+      except Exception as e:
+        self.error = e
+
+  def writable (self):
+    return True
+
+  def write (self, b):
+    if self.error is not None:
+      raise self.error
+    self.chunks.put(bytes(b))
+    return len(b)
+
+  def close (self):
+    if not self.closed:
+      self.chunks.put(None)
+      self.thread.join()
+      self.raw.close()
+    super().close()
+    if self.error is not None:
+      raise self.error
+
+
+# Open a formula or ordering for reading, 'r' (text) or 'rb'
+def open_input (path, mode='r'):
+  kind = detect_compression (path)
+  if kind is None:
+    return open(path, mode, buffering=CHUNK_SIZE)
+
+  stream = io.BufferedReader(ThreadedReader(raw_reader(path, kind)), CHUNK_SIZE)
+  if 'b' in mode:
+    return stream
+  return io.TextIOWrapper(stream, encoding='utf-8')
+
+# Open an output file for writing, 'w' (text) or 'wb', compressed by suffix
+def open_output (path, mode='w'):
+  kind = suffix_compression (path)
+  if kind is None:
+    return open(path, mode, buffering=CHUNK_SIZE)
+
+  stream = io.BufferedWriter(ThreadedWriter(raw_writer(path, kind)), CHUNK_SIZE)
+  if 'b' in mode:
+    return stream
+  return io.TextIOWrapper(stream, encoding='utf-8')
+
+# Path of a plain copy of the file, inflated into work_dir when compressed
+def decompressed_path (path, work_dir):
+  if detect_compression (path) is None:
+    return path
+
+  plain = os.path.join(work_dir, os.path.basename(strip_compression(path)))
+  with open_input(path, 'rb') as src, open(plain, 'wb') as dst:
+    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+  return plain
@@ -0,0 +1,244 @@
+import sys
+import os
+import getopt
+import csv
+import json
+import math
+import time
+import importlib.util
+from knf import parse_knf, CLAUSE
+from orderings import AMO_DETECT, GRAPH_ORDERINGS
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+Cost model for the automatic ordering selection (order_and_encode.py -v auto).
+
+For every encoding and ordering configuration of the paper experiments, two
+linear models are fitted offline on the data CSVs,
+
+  pre    log(1 + Pre-WALL), the preprocessing (ordering and encoding) time
+  total  min(Pre-WALL + solve-Wall, BUDGET), the time to solve the formula,
+         a timeout counts as the whole budget
+
+over cheap features of the formula, known right after the parse,
+
+  1, log(1 + hard clauses), log(1 + variables), log(1 + soft units),
+  soft units / variables
+
+(the hard clauses, variables and soft units of maxSAT_formula_info.csv). The
+CSVs do not record binary clauses or AMO constraints, so those are not part of
+the model. The coefficients are fitted with ridge regression and stored in
+cost_model.json.
+
+The selected configuration is the one with the smallest predicted total time
+among the configurations whose predicted preprocessing fits in the budget, or
+in the time left before the deadline of order_and_encode.py -l when sooner.
+Encodings without data use the kmtotalizer model, the graph ordering is only
+a candidate when numpy and networkx are installed.
+
+PAMO and PAMO+Occur detect the AMO constraints with amo_detect, as in the
+paper, and are only candidates when it is compiled (tools/AMO_detection/build.sh).
+PAMODirect (direct AMO constraints only, in-process) has no data.
+
+Default Exuection:
+
+  Fitting the model, from the repository root,
+
+  > python3 tools/cost_model.py -f data [-o tools/cost_model.json]
+
+  Predictions for a formula,
+
+  > python3 tools/cost_model.py -k <KNF> [-e <encoding>]
+
+Note on modules,
+
+  numpy is only needed to fit the model, the predictions are plain python
+'''
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(TOOLS_DIR, "cost_model.json")
+
+# timeout of the paper experiments, seconds
+BUDGET = 1800
+
+DEFAULT_ENCODING = "kmtotalizer"
+
+# encoding names of the CSVs -> order_and_encode encodings
+CSV_ENCODINGS = {
+  "kmtotalizer": "kmtotalizer",
+  "mtotalizer": "mtotalizer",
+  "sequential": "seqcounter",
+  "cardnetwork": "cardnetwrk",
+  "sortnetwork": "sortnetwrk",
+}
+
+# configuration names of the CSVs -> orderings (random and natural+PAMO are not candidates)
+CSV_CONFIGURATIONS = {
+  "Natural": "natural",
+  "Occurrence": "occurence",
+  "Proximity": "proximity",
+  "PAMO": "PAMO",
+  "PAMO+Occur": "PAMO+Occur",
+  "Graph": "graph",
+}
+
+FEATURES = ["bias", "log_hard_clauses", "log_variables", "log_soft_units", "soft_ratio"]
+
+# ridge regularisation, per training row
+RIDGE = 0.001
+
+def feature_vector (hard_clauses, variables, soft_units):
+  return [1.0, math.log1p(hard_clauses), math.log1p(variables), math.log1p(soft_units),
+          soft_units / max(variables, 1)]
+
+# Features of the parsed formula
+def formula_features (formula):
+  return feature_vector (len(formula.indices(CLAUSE)), formula.max_var, len(formula.soft_units()))
+
+# remove the -sat/-unsat suffix of a benchmark name
+def formula_base (name):
+  for suffix in ["-unsat", "-sat"]:
+    if name.endswith(suffix):
+      return name[:-len(suffix)]
+  return name
+
+# Rows (encoding, ordering, features, pre, total) of the data CSVs
+def training_rows (data_dir):
+  with open(os.path.join(data_dir, "maxSAT_formula_info.csv"), 'r') as f:
+    info = {line["Name"]: line for line in csv.DictReader(f)}
+
+  # kmtotalizer-paper.csv repeats part of all-encodings-paper.csv, one row per run
+  runs = {}
+  for name in ["all-encodings-paper.csv", "kmtotalizer-paper.csv"]:
+    with open(os.path.join(data_dir, name), 'r', encoding='utf-8-sig') as f:
+      for line in csv.DictReader(f):
+        runs[(line["Encoding"], line["Configuration"], line["Name"])] = line
+
+  rows = []
+  for ((encoding, configuration, name), line) in sorted(runs.items()):
+    if encoding not in CSV_ENCODINGS or configuration not in CSV_CONFIGURATIONS: continue
+    formula = info.get(formula_base (name))
+    if formula is None: continue
+
+    features = feature_vector (int(formula["HardClauses"]), int(formula["Variables"]), int(formula["SoftUnits"]))
+    pre = float(line["Pre-WALL"])
+    total = min(pre + float(line["solve-Wall"]), BUDGET)
+    rows.append((CSV_ENCODINGS[encoding], CSV_CONFIGURATIONS[configuration], features, pre, total))
+  return rows
+
+def ridge (X, y):
+  X = np.asarray(X)
+  A = X.T @ X + RIDGE * len(X) * np.eye(X.shape[1])
+  return np.linalg.solve(A, X.T @ np.asarray(y)).tolist()
+
+def fit_cost_model (data_dir):
+  if np is None:
+    raise ImportError("numpy is required to fit the cost model")
+
+  groups = {}
+  for (encoding, ordering, features, pre, total) in training_rows (data_dir):
+    groups.setdefault((encoding, ordering), []).append((features, pre, total))
+
+  encodings = {}
+  for ((encoding, ordering), group) in sorted(groups.items()):
+    X = [features for (features, _, _) in group]
+    encodings.setdefault(encoding, {})[ordering] = {
+      "pre": [round(w, 6) for w in ridge(X, [math.log1p(pre) for (_, pre, _) in group])],
+      "total": [round(w, 6) for w in ridge(X, [total for (_, _, total) in group])],
+      "rows": len(group),
+    }
+
+  return {"budget": BUDGET, "features": FEATURES, "encodings": encodings}
+
+def save_cost_model (model, path=MODEL_PATH):
+  with open(path, 'w') as f:
+    json.dump(model, f, indent=1, sort_keys=True)
+    f.write("\n")
+
+def load_cost_model (path=MODEL_PATH):
+  with open(path, 'r') as f:
+    return json.load(f)
+
+def dot (w, x):
+  return sum(a * b for (a, b) in zip(w, x))
+
+# orderings that can run here
+def available (ordering):
+  if ordering in GRAPH_ORDERINGS:
+    return np is not None and importlib.util.find_spec("networkx") is not None
+  if ordering in ["PAMO", "PAMO+Occur"]:
+    return os.path.exists(AMO_DETECT)
+  return True
+
+# Predicted (pre, total) seconds of every candidate configuration
+def predict (model, features, encoding_type=None):
+  budget = model["budget"]
+  models = model["encodings"].get(encoding_type, model["encodings"][DEFAULT_ENCODING])
+
+  predictions = {}
+  for (ordering, weights) in models.items():
+    if not available (ordering): continue
+    pre = max(0.0, math.expm1(dot(weights["pre"], features)))
+    total = min(max(dot(weights["total"], features), pre), budget)
+    predictions[ordering] = (pre, total)
+  return predictions
+
+# Configuration with the best predicted total time among those whose predicted
+# preprocessing fits the budget, or the time left before the deadline (a
+# time.time() value) when sooner (the cheapest preprocessing when none fits)
+def choose_ordering (formula, encoding_type=None, model=None, deadline=None):
+  if model is None:
+    model = load_cost_model ()
+
+  budget = model["budget"]
+  if deadline is not None:
+    budget = min(budget, deadline - time.time())
+
+  predictions = predict (model, formula_features (formula), encoding_type)
+  fitting = [o for o in predictions if predictions[o][0] < budget]
+  if len(fitting) == 0:
+    return min(predictions, key=lambda o: predictions[o][0])
+  return min(fitting, key=lambda o: predictions[o][1])
+
+
+def run(name, args):
+
+    knf_input = None
+    data_dir = None
+    model_path = MODEL_PATH
+    encoding_type = DEFAULT_ENCODING
+
+    optlist, args = getopt.getopt(args, "k:e:f:o:")
+    for (opt, val) in optlist:
+        if opt == '-k':
+            knf_input = val
+        elif opt == '-e':
+            encoding_type = val
+        elif opt == '-f':
+            data_dir = val
+        elif opt == '-o':
+            model_path = val
+
+    if data_dir is not None:
+      save_cost_model (fit_cost_model (data_dir), model_path)
+      return
+
+    if knf_input is None:
+      print("Error: give a data directory to fit (-f) or a formula to predict (-k)")
+      exit()
+
+    model = load_cost_model (model_path)
+    formula = parse_knf (knf_input)
+    features = formula_features (formula)
+    print("Ordering,Pre-WALL,Total-WALL")
+    for (ordering, (pre, total)) in sorted(predict (model, features, encoding_type).items(), key=lambda p: p[1][1]):
+      print(f"{ordering},{pre:.2f},{total:.2f}")
+    print("Selected " + choose_ordering (formula, encoding_type, model))
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
@@ -0,0 +1,254 @@
+import sys
+import getopt
+import json
+import time
+from array import array
+import multiprocessing
+
+from knf import parse_knf, CLAUSE
+from orderings import resolve_ordering_type, compute_ordering
+from ranks import sort_literals
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+Coverage statistic of a variable ordering.
+
+The clauses of the formula are restricted to the soft variables (variables in
+the cardinality constraint). Going through the soft variables in the order
+given by the ordering, a clause is covered once all of its soft variables have
+been seen. The coverage curve counts the covered clauses after each variable,
+
+  curve[0] = 0, curve[i] = clauses covered by the first i variables
+
+The restricted clauses are built once per formula in a CoverageIndex and can
+be evaluated for any number of orderings.
+
+  - with numpy, a clause is covered at the largest position of its variables
+    in the ordering, the curve is the cumulative count of those positions
+  - without numpy, each clause keeps a count of unseen variables and is covered
+    when the count reaches zero, each occurrence is touched once
+
+The area under the curve (auc) is normalised to [0,1], higher means clauses
+are covered earlier in the ordering.
+
+Coverage of several orderings from one parse and one index, optionally
+computing the orderings in parallel worker processes,
+
+  > python3 tools/coverage.py -k <KNF> -v occurence,proximity,natural,graph [-j <jobs>] [-f tikz|json|csv]
+'''
+
+class CoverageIndex:
+
+  def __init__ (self, formula, soft):
+    self.soft = sorted(set(soft))
+    self.max_var = formula.max_var
+
+    # restricted clauses, clause c is vars[offsets[c]:offsets[c+1]]
+    self.vars = array('i')
+    self.offsets = array('q', [0])
+    self.occs = None
+
+    if np is not None:
+      self.build_numpy (formula)
+      return
+
+    is_soft = bytearray(self.max_var+1)
+    for v in self.soft: is_soft[v] = 1
+
+    lits = formula.lits
+    offsets = formula.offsets
+    for i in range(len(formula)):
+      if formula.kinds[i] != CLAUSE: continue
+      restricted = [abs(l) for l in lits[offsets[i]:offsets[i+1]] if is_soft[abs(l)]]
+      if len(restricted) > 0:
+        self.vars.extend(restricted)
+        self.offsets.append(len(self.vars))
+
+  def build_numpy (self, formula):
+    lits, offsets, _, kinds = formula.as_numpy()
+    clause_of = np.repeat(np.arange(len(kinds)), np.diff(offsets))
+    variables = np.abs(lits)
+
+    is_soft = np.zeros(self.max_var+1, dtype=bool)
+    is_soft[np.asarray(self.soft, dtype=np.int64)] = True
+    keep = is_soft[variables] & (kinds[clause_of] == CLAUSE)
+
+    restricted = variables[keep].astype(np.int32)
+    clause_ids = clause_of[keep]
+    # a new restricted clause starts wherever the clause id changes
+    starts = np.flatnonzero(np.diff(clause_ids)) + 1
+
+    self.vars.frombytes(restricted.tobytes())
+    if len(restricted) > 0:
+      self.offsets.frombytes(np.concatenate((starts, [len(restricted)])).astype(np.int64).tobytes())
+
+  def num_clauses (self):
+    return len(self.offsets) - 1
+
+  # occurrence lists of the soft variables, only needed by the counter engine
+  def occurrences (self):
+    if self.occs is None:
+      self.occs = {}
+      for c in range(self.num_clauses()):
+        for v in self.vars[self.offsets[c]:self.offsets[c+1]]:
+          self.occs.setdefault(v, []).append(c)
+    return self.occs
+
+
+def coverage_curve (index, ranks):
+  order = sort_literals (index.soft, ranks)
+  if np is not None and index.num_clauses() > 0:
+    return numpy_curve (index, order)
+  return counter_curve (index, order)
+
+def numpy_curve (index, order):
+  position = np.zeros(index.max_var+1, dtype=np.int64)
+  position[np.asarray(order, dtype=np.int64)] = np.arange(1, len(order)+1)
+
+  clause_vars = np.frombuffer(index.vars, dtype=np.int32)
+  starts = np.frombuffer(index.offsets, dtype=np.int64)[:-1]
+  covered_at = np.maximum.reduceat(position[clause_vars], starts)
+
+  return np.cumsum(np.bincount(covered_at, minlength=len(order)+1)).tolist()
+
+def counter_curve (index, order):
+  occs = index.occurrences()
+  unseen = [index.offsets[c+1] - index.offsets[c] for c in range(index.num_clauses())]
+
+  nCov = 0
+  curve = [0]
+  for v in order:
+    for c in occs.get(v, []):
+      unseen[c] -= 1
+      if unseen[c] == 0:
+        nCov += 1
+    curve.append(nCov)
+  return curve
+
+def curve_auc (curve):
+  steps = len(curve) - 1
+  total = curve[-1]
+  if steps == 0 or total == 0:
+    return 0.0
+  return sum(curve[1:]) / (steps * total)
+
+# Coverage result of one ordering with its timings (seconds)
+def coverage_result (index, ranks, name, ordering, index_time=0.0, order_time=0.0):
+  start = time.time()
+  curve = coverage_curve (index, ranks)
+  curve_time = time.time() - start
+
+  return {
+    "name": name,
+    "ordering": ordering,
+    "soft_units": len(index.soft),
+    "clauses": index.num_clauses(),
+    "auc": curve_auc (curve),
+    "time": {"index": index_time, "order": order_time, "curve": curve_time},
+    "curve": curve,
+  }
+
+
+# Output formats
+
+colors = ["darkestblue","redpurple","browngreen","clearorange","darkpurple","greypurple","redorange","softblue","softgreen","clearyellow","mildgray"]
+
+marks = ["x", "o","diamond","square","star","+","triangle"]
+
+# plot style of the orderings in the paper
+def plot_index (ordering):
+  lst = ["occurence", "proximity" ,"PAMO", "natural", "graph"]
+  return lst.index(ordering) if ordering in lst else len(lst)
+
+def tikz_coverage (curve, cnt):
+  st = ("\\addplot[only marks, color="+colors[cnt%len(colors)]+",mark="+marks[cnt%len(marks)]+",opacity=0.5] coordinates { ")
+  st += ''.join("("+str(i) + "," + str(curve[i]) + ")" for i in range(len(curve)))
+  st += ("};")
+  return st
+
+CSV_HEADER = "Name,Ordering,SoftUnits,Clauses,AUC,Index-WALL,Order-WALL,Curve-WALL,Curve"
+
+def csv_coverage (result):
+  t = result["time"]
+  return ','.join([result["name"], result["ordering"], str(result["soft_units"]), str(result["clauses"]),
+                   str(result["auc"]), str(t["index"]), str(t["order"]), str(t["curve"]),
+                   ' '.join(str(x) for x in result["curve"])])
+
+def json_coverage (results):
+  return json.dumps(results)
+
+
+# Multi-ordering coverage. Worker processes are forked after the formula and
+# the index are built, so they share both copy-on-write instead of reparsing.
+# The pool is forked whatever the default start method (forkserver from
+# Python 3.14), without fork the orderings run one after the other.
+
+shared = {}
+
+def ordering_coverage (configuration):
+  formula = shared["formula"]
+  variable_ordering_type, random_seed, occLimit = resolve_ordering_type (configuration)
+
+  start = time.time()
+  ranks = compute_ordering (formula, variable_ordering_type, random_seed, occLimit, shared["cache_dir"])
+  order_time = time.time() - start
+
+  return coverage_result (shared["index"], ranks, formula.path, configuration, shared["index_time"], order_time)
+
+def multi_coverage (formula, configurations, jobs=1, cache_dir=None):
+  start = time.time()
+  index = CoverageIndex (formula, formula.soft_units())
+  index_time = time.time() - start
+
+  shared.update(formula=formula, index=index, index_time=index_time, cache_dir=cache_dir)
+
+  if jobs > 1 and len(configurations) > 1 and "fork" in multiprocessing.get_all_start_methods():
+    with multiprocessing.get_context("fork").Pool(min(jobs, len(configurations))) as pool:
+      return pool.map(ordering_coverage, configurations, chunksize=1)
+
+  return [ordering_coverage (configuration) for configuration in configurations]
+
+def print_coverages (results, coverage_format):
+  if coverage_format == "json":
+    print(json_coverage (results))
+  elif coverage_format == "csv":
+    print(CSV_HEADER)
+    for result in results:
+      print(csv_coverage (result))
+  else:
+    for result in results:
+      print("% Coverage for " + result["ordering"])
+      print(tikz_coverage (result["curve"], plot_index (result["ordering"])))
+
+
+def run(name, args):
+
+    knf_input = None
+    configurations = ["occurence", "proximity", "natural", "graph"]
+    coverage_format = "tikz"
+    cache_dir = None
+    jobs = 1
+
+    optlist, args = getopt.getopt(args, "k:v:f:d:j:")
+    for (opt, val) in optlist:
+        if opt == '-k':
+            knf_input = val
+        elif opt == '-v':
+            configurations = val.split(",")
+        elif opt == '-f':
+            coverage_format = val
+        elif opt == '-d':
+            cache_dir = val
+        elif opt == '-j':
+            jobs = int(val)
+
+    results = multi_coverage (parse_knf (knf_input), configurations, jobs, cache_dir)
+    print_coverages (results, coverage_format)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
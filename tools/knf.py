@@ -0,0 +1,375 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from compressed_io import open_input, detect_compression, strip_compression
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+Shared KNF formula object used by every stage of the preprocessor
+(ordering, coverage, renaming and encoding).
+
+The formula is parsed once into flat arrays instead of a Python list per clause,
+
+  lits    : all literals of all constraints in file order, array('i')
+  offsets : constraint i is lits[offsets[i]:offsets[i+1]], array('q')
+  bounds  : bound of each constraint (1 for a standard clause), array('i')
+  kinds   : CLAUSE, CARD or AMO tag of each constraint, array('b')
+
+Supported lines,
+
+  p knf <maxVariable> <numberConstraints>
+  c <comment>
+  k <bound> <literals> 0
+  m <bound> <literals> 0   (AMO constraint, as printed by amo_detect)
+  <literals> 0
+
+Binary sidecar (.knfb),
+
+  The first parse of <name>.knf writes <name>.knfb next to it (or <name>-<hash of
+  the source path>.knfb into $KNFB_DIR),
+  later parses memory map the sidecar and the four arrays are zero copy memoryviews
+  of the mapping. The sidecar is only used while the size and modification time of
+  the source match the ones recorded in its header. Formulas loaded from a sidecar
+  are read-only (no append).
+
+    header  : "KNFB", version, source size, source mtime (ns), max_var, num_cls,
+              number of constraints, number of literals
+    lits    : int32, padded to 8 bytes
+    offsets : int64
+    bounds  : int32
+    kinds   : int8
+
+Note on modules,
+
+  numpy is optional, when available as_numpy() returns zero copy views of the arrays
+  and parse_knf uses the bulk tokenizer (parse_knf_buffer) on the memory mapped file
+'''
+
+CLAUSE = 0
+CARD = 1
+AMO = 2
+
+NEWLINE = ord('\n')
+SPACE = ord(' ')
+
+KNFB_MAGIC = b"KNFB"
+KNFB_VERSION = 1
+KNFB_HEADER = struct.Struct("<4sIqqqqqq")
+
+if np is not None:
+  # first bytes of the lines parsed in bulk (clauses, k and m lines)
+  NUMERIC_HEAD = np.zeros(256, dtype=bool)
+  NUMERIC_HEAD[[ord(c) for c in "-0123456789km"]] = True
+
+
+class KnfFormula:
+
+  def __init__ (self, max_var=0, num_cls=0):
+    self.max_var = max_var  # from the header
+    self.num_cls = num_cls  # from the header
+    self.path = None        # source file, used by orderings that call external binaries
+    self.lits = array('i')
+    self.offsets = array('q', [0])
+    self.bounds = array('i')
+    self.kinds = array('b')
+
+  def __len__ (self):
+    return len(self.bounds)
+
+  def append (self, kind, bound, literals):
+    self.lits.extend(literals)
+    self.offsets.append(len(self.lits))
+    self.bounds.append(bound)
+    self.kinds.append(kind)
+
+  # literals of constraint i as a list
+  def literals (self, i):
+    return self.lits[self.offsets[i]:self.offsets[i+1]].tolist()
+
+  def size (self, i):
+    return self.offsets[i+1] - self.offsets[i]
+
+  # (bound, literals) pairs for clauses and cardinality constraints,
+  # same shape as the klauses list used by the original scripts
+  def klauses (self):
+    lits = self.lits
+    offsets = self.offsets
+    for i in range(len(self.bounds)):
+      if self.kinds[i] == AMO: continue
+      yield self.bounds[i], lits[offsets[i]:offsets[i+1]].tolist()
+
+  def indices (self, kind):
+    return [i for i in range(len(self.kinds)) if self.kinds[i] == kind]
+
+  # variables appearing in cardinality constraints, sorted and without duplicates
+  def soft_units (self):
+    seen = set()
+    for i in self.indices(CARD):
+      seen.update(abs(l) for l in self.lits[self.offsets[i]:self.offsets[i+1]])
+    return sorted(seen)
+
+  # new formula with every variable v replaced by var_map[v]
+  def renamed (self, var_map):
+    new_formula = KnfFormula(self.max_var, self.num_cls)
+    new_formula.lits = array('i', (var_map[l] if l > 0 else -var_map[-l] for l in self.lits))
+    new_formula.offsets = array('q', self.offsets)
+    new_formula.bounds = array('i', self.bounds)
+    new_formula.kinds = array('b', self.kinds)
+    return new_formula
+
+  # Content hash of the formula. With ignore_bounds the bounds of the cardinality
+  # constraints are left out, so the -sat/-unsat pair of a benchmark share a digest.
+  def digest (self, ignore_bounds=True):
+    bounds = array('i', self.bounds)
+    if ignore_bounds:
+      for i in self.indices(CARD):
+        bounds[i] = 0
+
+    h = hashlib.sha256()
+    h.update(str(self.max_var).encode())
+    for data in (self.lits, self.offsets, bounds, self.kinds):
+      h.update(memoryview(data).cast('B'))
+    return h.hexdigest()
+
+  # text line of constraint i in KNF format
+  def line (self, i):
+    lits = ' '.join(str(l) for l in self.lits[self.offsets[i]:self.offsets[i+1]])
+    if self.kinds[i] == CARD:
+      return "k " + str(self.bounds[i]) + " " + lits + " 0\n"
+    if self.kinds[i] == AMO:
+      return "m " + str(self.bounds[i]) + " " + lits + " 0\n"
+    return lits + " 0\n"
+
+  # zero copy numpy views (lits, offsets, bounds, kinds)
+  def as_numpy (self):
+    if np is None:
+      raise ImportError("numpy is required for as_numpy")
+    return (np.frombuffer(self.lits, dtype=np.int32),
+            np.frombuffer(self.offsets, dtype=np.int64),
+            np.frombuffer(self.bounds, dtype=np.int32),
+            np.frombuffer(self.kinds, dtype=np.int8))
+
+
+def parse_knf_lines (lines):
+  formula = KnfFormula()
+
+  for line in lines:
+    tokens = line.split()
+
+    if len(tokens) == 0: # empty line
+      continue
+
+    head = tokens[0]
+
+    if head == "p": # pcnf header
+      formula.max_var = int(tokens[2])
+      formula.num_cls = int(tokens[3])
+
+    elif head == "c": # comment
+      continue
+
+    elif head == "k": # cardinality constraint
+      formula.append(CARD, int(tokens[1]), map(int, tokens[2:-1]))
+
+    elif head == "m": # AMO constraint
+      formula.append(AMO, int(tokens[1]), map(int, tokens[2:-1]))
+
+    else: # standard clause, remove last '0'
+      formula.append(CLAUSE, 1, map(int, tokens[:-1]))
+
+  return formula
+
+
+# Bulk tokenizer, parses the whole file content at once with numpy.
+#
+#  1. Split the buffer into tokens (runs of non-whitespace bytes) and give each token its line
+#  2. Lines starting with a letter other than k/m (p header, c comments) take the slow path
+#  3. Every other token is converted to an integer, one vectorized step per digit position
+#  4. Each remaining line is one constraint: the last token (0) is dropped, k/m lines
+#     take their bound from the second token
+#
+# Same result as parse_knf_lines, but python only touches the header and comment lines.
+def parse_knf_buffer (data):
+  formula = KnfFormula()
+
+  buf = np.frombuffer(data, dtype=np.uint8)
+  if len(buf) == 0:
+    return formula
+
+  is_tok = buf > SPACE # whitespace and control bytes separate tokens
+  edges = np.diff(is_tok.view(np.int8), prepend=0, append=0)
+  starts = np.flatnonzero(edges == 1)
+  ends = np.flatnonzero(edges == -1)
+  newlines = np.flatnonzero(buf == NEWLINE)
+  line_of = np.searchsorted(newlines, starts)
+
+  first = np.ones(len(starts), dtype=bool)
+  first[1:] = line_of[1:] != line_of[:-1]
+  head = buf[starts]
+
+  # slow path, header and comment lines
+  slow = first & ~NUMERIC_HEAD[head]
+  for t in np.flatnonzero(slow):
+    line_end = newlines[line_of[t]] if line_of[t] < len(newlines) else len(buf)
+    tokens = bytes(buf[starts[t]:line_end]).decode().split()
+
+    if tokens[0] == "p": # pcnf header
+      formula.max_var = int(tokens[2])
+      formula.num_cls = int(tokens[3])
+    elif tokens[0] != "c": # not a comment
+      raise ValueError("unexpected KNF line: " + ' '.join(tokens))
+
+  if slow.any():
+    keep = ~np.isin(line_of, line_of[slow])
+    starts, ends, first, head = starts[keep], ends[keep], first[keep], head[keep]
+  if len(starts) == 0:
+    return formula
+
+  # integer value of every token, the k/m letters are given 0
+  letter = first & ((head == ord('k')) | (head == ord('m')))
+  negative = head == ord('-')
+  digits_start = starts + negative
+  length = np.where(letter, 0, ends - digits_start)
+  values = np.zeros(len(starts), dtype=np.int64)
+  for k in range(int(length.max())):
+    active = np.flatnonzero(length > k)
+    digit = buf[digits_start[active] + k].astype(np.int64) - ord('0')
+    if ((digit < 0) | (digit > 9)).any():
+      raise ValueError("invalid literal in KNF formula")
+    values[active] = values[active] * 10 + digit
+  values[negative] *= -1
+
+  # one constraint per line
+  firsts = np.flatnonzero(first)
+  last = np.ones(len(starts), dtype=bool)
+  last[:-1] = first[1:]
+  is_bound = np.zeros(len(starts), dtype=bool)
+  is_bound[1:] = letter[:-1]
+  is_lit = ~(last | letter | is_bound)
+
+  constraint_of = np.cumsum(first) - 1
+  counts = np.bincount(constraint_of[is_lit], minlength=len(firsts))
+
+  kinds = np.full(len(firsts), CLAUSE, dtype=np.int8)
+  kinds[head[firsts] == ord('k')] = CARD
+  kinds[head[firsts] == ord('m')] = AMO
+  bounds = np.ones(len(firsts), dtype=np.int32)
+  has_bound = kinds != CLAUSE
+  bounds[has_bound] = values[firsts[has_bound] + 1]
+
+  formula.lits.frombytes(values[is_lit].astype(np.int32).tobytes())
+  formula.offsets.frombytes(np.cumsum(counts, dtype=np.int64).tobytes())
+  formula.bounds.frombytes(bounds.tobytes())
+  formula.kinds.frombytes(kinds.tobytes())
+  return formula
+
+
+# Binary sidecar of a KNF file, a.knf maps to a.knfb and a compressed a.knf.xz
+# to a.knf.xz.knfb, so the two do not overwrite each other's sidecar. In
+# $KNFB_DIR the name also holds a hash of the source path, so dir1/a.knf and
+# dir2/a.knf (possibly with the same size and mtime) do not share a sidecar.
+def sidecar_path (knf_input):
+  base = os.path.splitext(knf_input)[0] if strip_compression(knf_input) == knf_input else knf_input
+  knfb_dir = os.environ.get("KNFB_DIR")
+  if knfb_dir is not None:
+    source = hashlib.sha256(os.path.abspath(knf_input).encode()).hexdigest()[:16]
+    return os.path.join(knfb_dir, os.path.basename(base) + "-" + source + ".knfb")
+  return base + ".knfb"
+
+def pad8 (n):
+  return (n + 7) & ~7
+
+# Write the sidecar atomically, silently skipped when the directory is not writable
+def write_sidecar (formula, knf_input):
+  path = sidecar_path(knf_input)
+  try:
+    st = os.stat(knf_input)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+  except OSError:
+    return
+
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(KNFB_HEADER.pack(KNFB_MAGIC, KNFB_VERSION, st.st_size, st.st_mtime_ns,
+                               formula.max_var, formula.num_cls, len(formula), len(formula.lits)))
+      lits = memoryview(formula.lits).cast('B')
+      f.write(lits)
+      f.write(bytes(pad8(len(lits)) - len(lits)))
+      for data in (formula.offsets, formula.bounds, formula.kinds):
+        f.write(memoryview(data).cast('B'))
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+  except OSError:
+    try:
+      os.remove(tmp_path)
+    except OSError:
+      pass
+
+# Zero copy load of a valid sidecar, None when missing or stale
+def load_sidecar (knf_input):
+  try:
+    st = os.stat(knf_input)
+    with open(sidecar_path(knf_input), 'rb') as f:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError):
+    return None
+
+  if len(data) < KNFB_HEADER.size:
+    return None
+  magic, version, size, mtime, max_var, num_cls, n, n_lits = KNFB_HEADER.unpack_from(data)
+  if (magic, version, size, mtime) != (KNFB_MAGIC, KNFB_VERSION, st.st_size, st.st_mtime_ns):
+    return None
+
+  lits_end = KNFB_HEADER.size + 4*n_lits
+  offsets_end = KNFB_HEADER.size + pad8(4*n_lits) + 8*(n+1)
+  if len(data) != offsets_end + 4*n + n:
+    return None
+
+  view = memoryview(data)
+  formula = KnfFormula(max_var, num_cls)
+  formula.lits = view[KNFB_HEADER.size:lits_end].cast('i')
+  formula.offsets = view[offsets_end - 8*(n+1):offsets_end].cast('q')
+  formula.bounds = view[offsets_end:offsets_end + 4*n].cast('i')
+  formula.kinds = view[offsets_end + 4*n:].cast('b')
+  return formula
+
+# Parse a KNF file once into a KnfFormula (plain or compressed, see compressed_io.py).
+# A valid .knfb sidecar is loaded instead of parsing, otherwise one is written after
+# the parse. Plain files are memory mapped and go through the bulk tokenizer, without
+# numpy the file is parsed line by line.
+def parse_knf (knf_input, sidecar=True):
+  formula = load_sidecar(knf_input) if sidecar else None
+  if formula is not None:
+    formula.path = knf_input
+    return formula
+
+  formula = parse_knf_text(knf_input)
+  if sidecar:
+    write_sidecar(formula, knf_input)
+  formula.path = knf_input
+  return formula
+
+def parse_knf_text (knf_input):
+  if np is None:
+    with open_input(knf_input) as knf_lines:
+      formula = parse_knf_lines(knf_lines)
+
+  elif detect_compression(knf_input) is None and os.path.getsize(knf_input) > 0:
+    with open(knf_input, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+      formula = parse_knf_buffer(data)
+
+  else:
+    with open_input(knf_input, 'rb') as f:
+      formula = parse_knf_buffer(f.read())
+
+  return formula
+
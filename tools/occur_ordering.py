@@ -1,15 +1,21 @@
-from functools import cmp_to_key
 import sys
 import getopt
 import random
-# import lzma
+from array import array
+from knf import parse_knf, CARD, CLAUSE
+from ranks import ranks_from_order, order_from_ranks
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
 
 '''
 This script parses a KNF formula and returns a variable ordering by
 
   1. Parsing the KNF
-  2. Counts occurences (during parsing)
+  2. Counts occurences on the parsed formula
   5. Prints the ordeirng
 
 
@@ -17,69 +23,37 @@ Default Exuection:
 
   > python3 occur_ordering.py <KNF> > <ORDER>
 
+Scoring modes (-m),
 
-Note on modules,
-
-  Assuming the input is not zipped with lzma so commenting code to reduce dependencies
-'''
-
-def trim(s):
-    while len(s) > 0 and s[-1] in '\r\n':
-        s = s[:-1]
-    return s
-    
-def remove_comment(s):
-  for i in range(len(s)):
-    if s[i] == 'c': return s[:i]
-  return s
-  
-def generate_occ_ordering (knf_input):
+  count     : occurrences in the clauses, the bound for a cardinality constraint (default)
+  polarity  : positive and negative occurrences counted separately, variables ordered
+              by their most frequent polarity then by the total
+  jw        : Jeroslow-Wang, a clause of length n adds 2^-n to each of its variables,
+              a cardinality literal counts as bound binary clauses
 
+With numpy, the counts are one bincount over the flat literal array.
 
-  # open knf formula (likely zipped with xz)
-  knf_lines = None
-  # if (knf_input.endswith('.xz')):
-  #   knf_lines = lzma.open(knf_input, mode='rt', encoding='utf-8')
-  # else:
-  knf_lines = open(knf_input, 'r')
 
+Note on modules,
 
-  clauses = [] # clauses (list of list of integers)
-  max_var = None  # max variables used to set new auxiliary variables in encodings
+  The KNF may be compressed (.xz, .gz, .bz2, .zst), see compressed_io.py
+'''
 
-  # get number of variables from header for 
-  for line in knf_lines:
-    line = trim(line)
-    tokens = line.split()
+OCC_MODES = ["count", "polarity", "jw"]
 
-    if tokens[0] == "p": # pcnf header
-      max_var = int(tokens[2])
-      break
+# Variables of the parsed formula sorted by occurrence count (descending)
+def occurrence_order (formula):
+  max_var = formula.max_var
 
+  # 2. Count occurrences
   var_occ_cnt = [0] * (max_var + 1)
-  
 
+  for i in range(len(formula)):
 
+    if formula.kinds[i] == CARD: # cardinality constraint
+      bound = formula.bounds[i]
 
-  # 1. Parse KNF formula
-  for line in knf_lines:
-    line = trim(line)
-    tokens = line.split()
-
-    if len(tokens) == 0: # empty line
-       continue
-
-    if tokens[0] == "p": # pcnf header
-      continue
-  
-    if tokens[0] == "c": # comment
-       continue
-    
-    if tokens[0] == "k": # cardinality constraint
-      literals = [int(lit) for lit in tokens[2:-1]]
-      bound = int (tokens[1])
-      
-      for l in literals:
+      for l in formula.literals(i):
         # use bound as crude estimate of # occs in clauses
         # Does not affect AAAI orderings because MaxSAT problems have 
         # one large cardinality constraint so all of those soft units
@@ -87,35 +61,77 @@ def generate_occ_ordering (knf_input):
         # in the hard clauses.
         var_occ_cnt [abs(l)] += bound 
 
-    else: # standard clause
-      literals = [int (lit) for lit in tokens[:-1]] # remove last '0'
-      for l in literals:
+    elif formula.kinds[i] == CLAUSE: # standard clause
+      for l in formula.literals(i):
          var_occ_cnt [abs(l)] += 1
 
-  knf_lines.close()
-
   ps = list (zip (range(1,max_var+1),var_occ_cnt[1:]))
 
   # Sort in descending order
   ps.sort(key=lambda x : x[1], reverse=True)
 
+  return [v for (v, cnt) in ps]
+
+# Occurrence ordering as a rank array, counted with bincount over the flat
+# literal array. Ties keep the variable order, as in occurrence_order.
+def occurrence_ranks (formula, mode="count"):
+  if mode not in OCC_MODES:
+    raise ValueError(f"unknown occurrence mode {mode}")
+  if np is None:
+    if mode != "count":
+      raise ImportError(f"numpy is required for the {mode} occurrence mode")
+    return ranks_from_order(occurrence_order(formula), formula.max_var)
+
+  max_var = formula.max_var
+  lits, offsets, bounds, kinds = formula.as_numpy()
+  sizes = np.diff(offsets)
+  kind_of = np.repeat(kinds, sizes)
+  bound_of = np.repeat(bounds, sizes)
+
+  # weight of every literal occurrence, AMO constraints do not count
+  weights = np.where(kind_of == CARD, bound_of, 1).astype(np.float64)
+  weights[(kind_of != CARD) & (kind_of != CLAUSE)] = 0
+  if mode == "jw":
+    weights[kind_of == CLAUSE] = np.exp2(-np.repeat(sizes, sizes)[kind_of == CLAUSE])
+    weights[kind_of == CARD] *= 0.25
+
+  variables = np.abs(lits)
+  if mode == "polarity":
+    positive = np.bincount(variables[lits > 0], weights[lits > 0], minlength=max_var + 1)[1:]
+    negative = np.bincount(variables[lits < 0], weights[lits < 0], minlength=max_var + 1)[1:]
+    order = np.lexsort((-(positive + negative), -np.maximum(positive, negative)))
+  else:
+    scores = np.bincount(variables, weights, minlength=max_var + 1)[1:]
+    order = np.argsort(-scores, kind='stable')
+
+  ranks = np.zeros(max_var + 1, dtype=np.int32)
+  ranks[order + 1] = np.arange(1, max_var + 1, dtype=np.int32)
+  return array('i', ranks.tobytes())
+
+def generate_occ_ordering (knf_input, mode="count"):
+
+  # 1. Parse KNF formula
+  formula = parse_knf (knf_input)
+
+  ranks = occurrence_ranks (formula, mode)
+
   # 3. Print ordering
-  l = []
-  for i in range(max_var):
-     l.append(str(ps[i][0]))
-  print(' '.join(l))
+  print(' '.join(str(v) for v in order_from_ranks (ranks, formula.max_var)))
 
     
 def run(name, args):
     
     knf_input = None
+    mode = "count"
     
-    optlist, args = getopt.getopt(args, "k:")
+    optlist, args = getopt.getopt(args, "k:m:")
     for (opt, val) in optlist:
         if opt == '-k':
             knf_input = val
+        elif opt == '-m':
+            mode = val
     
-    generate_occ_ordering (knf_input)
+    generate_occ_ordering (knf_input, mode)
     
 if __name__ == "__main__":
     run(sys.argv[0], sys.argv[1:])
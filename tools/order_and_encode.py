@@ -1,10 +1,18 @@
-from functools import cmp_to_key
 import sys
 import getopt
 import random
 import os
+import time
 # from pysat import *
 from pysat.card import *
+from itertools import chain
+from knf import parse_knf, CARD, AMO
+from cnf_writer import CnfWriter
+from compressed_io import open_input, open_output, strip_compression
+from coverage import CoverageIndex, coverage_result, plot_index, tikz_coverage, csv_coverage, json_coverage, CSV_HEADER
+from orderings import resolve_ordering_type, compute_ordering
+from cost_model import choose_ordering
+from ranks import ranks_from_order, sort_literals, order_from_ranks, soft_renaming
 
 
 
@@ -12,7 +20,7 @@ from pysat.card import *
 This script parses a KNF formula orders literals within cardinality constraints, then encodes to CNF
 
   1. Parsing the KNF
-  2. Run some variable ordering algorithm
+  2. Run some variable ordering algorithm (registered in orderings.py)
   3. Encode cardinality constraints with new ordering and given encoding type
   4. Print the CNF
 
@@ -32,248 +40,171 @@ Note on modules,
 
   pysat module is included in the supplementary materials Readme
 
-'''
-
-def trim(s):
-    while len(s) > 0 and s[-1] in '\r\n':
-        s = s[:-1]
-    return s
-    
-def remove_comment(s):
-  for i in range(len(s)):
-    if s[i] == 'c': return s[:i]
-  return s
+  KNF inputs, ordering files and CNF outputs may be compressed (.xz, .gz, .bz2, .zst), see compressed_io.py
 
-def write_clause(file, clause):
-   file.write(' '.join(str (lit) for lit in (clause + [0])) + "\n")
+'''
 
 def write_hclause(file, clause):
    file.write("h " + ' '.join(str (lit) for lit in (clause + [0])) + "\n")
 
-# sort the literals based on the positions in the var_map
-# the smaller the value, the closer to the front of the list
-# example: with map [1->3, 2->2, 3->1] and literals [1,2,3] return [3,2,1]
-def sort_literals(literals, var_map):
-   def compare_map(e1,e2):
-      if var_map[abs(e1)] >= var_map[abs(e2)]:
-         return 1 
-      else:
-         return -1
-      
-   new_lits = sorted(literals, key=cmp_to_key(compare_map))
-   return new_lits
-  
-# Parse the ordering returns by an ordering algorithm
-def parse_ordering (in_file, var_map, max_var):
-  lines = open(in_file, 'r')
-  cnt = 1
-
-  already_parsed = {}
-
-  for line in lines:
-    line = trim(line)
-    tokens = line.split()
-
-    for sv in tokens:
-      v = abs(int(sv))
-
-      if v in already_parsed:
-        print("Error, appears twice")
-        exit ()
-      else:
-        already_parsed[v] = 1
-
-      var_map[v] = cnt
-      cnt += 1
-
-  return var_map
-
-# 1. Parse the KNF formula
-def parse_knf (knf_input):
-  knf_lines = open(knf_input, 'r')
-  
-  klauses = []
-  soft_units = []
-
-  for line in knf_lines:
-    line = trim(line)
-    tokens = line.split()
-
-    if len(tokens) == 0: # empty line
-       continue
+# Parse an ordering file (variables separated by whitespace)
+def parse_ordering (in_file, max_var):
+  with open_input(in_file) as lines:
+    order = [int(sv) for line in lines for sv in line.split()]
 
-    if tokens[0] == "p": # pcnf header
-      continue
-  
-    if tokens[0] == "c": # comment
-       continue
-    
-    if tokens[0] == "k": # cardinality constraint
-      literals = [int(lit) for lit in tokens[2:-1]]
-      bound = int (tokens[1])
-
-      klauses.append ((bound, literals))
-      soft_units += [abs(int(lit)) for lit in tokens[2:-1]]
-
-    else: # standard clause
-      literals = [int (lit) for lit in tokens[:-1]] # remove last '0'
-      klauses.append((1,literals))
+  return ranks_from_order (order, max_var)
 
+# Write the ordering as a file that can be passed back with -t
+def write_ordering (out_file, var_map, max_var):
+  with open_output(out_file) as f:
+    f.write(' '.join(str(v) for v in order_from_ranks (var_map, max_var)) + "\n")
 
-  return klauses, list(set(soft_units))
+# Print the coverage statistic, using tikz style printing format by default
+def print_coverage (formula, var_map, soft_units, variable_ordering_type, coverage_format, order_time=0.0):
+  start = time.time()
+  index = CoverageIndex (formula, soft_units)
+  index_time = time.time() - start
 
-def parse_knf_remove_soft (knf_input, soft):
-  knf_lines = open(knf_input, 'r')
-  
-  clauses = []
-  is_soft = {}
-  occs = {}
-  for v in soft: is_soft[v] = 1
-
-  for line in knf_lines:
-    line = trim(line)
-    tokens = line.split()
+  result = coverage_result (index, var_map, formula.path, variable_ordering_type, index_time, order_time)
 
-    if len(tokens) == 0: # empty line
-       continue
-
-    if tokens[0] == "p": # pcnf header
-      continue
-  
-    if tokens[0] == "c": # comment
-       continue
-    
-    if tokens[0] == "k": # cardinality constraint
-      continue
+  if coverage_format == "json":
+    print(json_coverage ([result]))
+  elif coverage_format == "csv":
+    print(CSV_HEADER)
+    print(csv_coverage (result))
+  else:
+    print(tikz_coverage (result["curve"], plot_index (variable_ordering_type)))
+
+
+# PySAT encoding types selectable with -e
+ENCODINGS = {
+  "seqcounter": EncType.seqcounter,
+  "totalizer": EncType.totalizer,
+  "sortnetwrk": EncType.sortnetwrk,
+  "cardnetwrk": EncType.cardnetwrk,
+  "mtotalizer": EncType.mtotalizer,
+  "kmtotalizer": EncType.kmtotalizer,
+}
+
+def check_encoding (encoding_type):
+  if encoding_type != "original_cardinality" and encoding_type not in ENCODINGS:
+    raise ValueError(f"encoding type {encoding_type} not recognized")
+
+# Encode one at-least-bound cardinality constraint (literals already sorted),
+# returns the clauses and the new max variable
+def encode_cardinality (literals, bound, max_var, encoding_type):
+  if encoding_type == "original_cardinality":
+    return [["k",str(bound)] + literals], max_var
 
-    else: # standard clause
-      literals = [abs (int (lit)) for lit in tokens[:-1] if (abs(int(lit))) in is_soft] # remove last '0'
-      if len(literals) > 0: clauses.append(literals)
-
-      for v in literals:
-        if v not in occs:
-          occs[v] = [len(clauses) - 1]
-        else:
-          occs[v].append(len(clauses) - 1)
-
-  return clauses, occs
-
-# Print the coverage statistic, using tikz style printing format
-def print_coverage (order, soft, clauses, occs,maxVar, cnt):
-
-  colors = ["darkestblue","redpurple","browngreen","clearorange","darkpurple","greypurple","redorange","softblue","softgreen","clearyellow","mildgray"]
-
-  marks = ["x", "o","diamond","square","star","+","triangle"]
-
-
-  shuff_vars = sort_literals (soft,order)
-  nCov = 0
-  nCovs = []
-  cls_done = {}
-  lit_seen = [0]*(maxVar+1)
-
-  # loop over the variables in the new ordering
-  for v in shuff_vars:
-    lit_seen[v] = 1
-    # append the new count of covered clauses (init at 0)
-    nCovs.append(nCov)
-    if v not in occs: continue
-    for cid in occs[v]:
-      if cid in cls_done: continue 
-      notS = False
-      for v in clauses[cid]:
-        if lit_seen[v] == 0: 
-          notS = True 
-          break
-      if notS:
-        continue 
-      # new clause has been covered
-        # mark as covered and add one to covered count
-      cls_done[cid] = 1
-      nCov += 1
-  # append the final count of covered clauses = number of clauses in the formula touhced by variables in cardinality constraints
-  nCovs.append(nCov)
-
-  # print the coverage
-  st = ("\\addplot[only marks, color="+colors[cnt%len(colors)]+",mark="+marks[cnt%len(marks)]+",opacity=0.5] coordinates { ")
-  for i in range(len(nCovs)):
-    st +=  ("("+str(i) + "," + str(nCovs[i]) + ")")
-  st += ("};")
-  print(st)
-      
+  # encode using the specific encoding type from PySAT
+  new_cnf = CardEnc.atleast(literals, bound, max_var, encoding=ENCODINGS[encoding_type])
 
-def sign_int (l):
-  if l > 0: return 1
-  else: return -1
+  # Update max variable from the encoder's top variable
+  return new_cnf.clauses, max(max_var, new_cnf.nv)
 
-def rename_knf (klauses, var_map, max_var):
-  new_klauses = []
+# Write the formula through the streaming writer, constraints in encoded
+# (constraint index -> clauses) replace the cardinality constraints
+def stream_cnf (formula, encoded, max_var, num_cls, cnf_output, encoding_type):
+  with CnfWriter (cnf_output) as writer:
 
-  for (bound,lits) in klauses:
-    new_lits = [sign_int (l) *var_map[abs(l)] for l in lits]
-    new_klauses.append((bound,new_lits))
+    # header  
+    if encoding_type == "original_cardinality":
+      writer.header ("knf", max_var, num_cls)
+    else:
+      writer.header ("cnf", max_var, num_cls)
 
-  return new_klauses
+    # loop over input KNF formula, replacing cardinality constraints with encoded clauses
+    lits = formula.lits
+    offsets = formula.offsets
+    for i in range(len(formula)):
+      if formula.kinds[i] == AMO: continue
 
+      if i in encoded:
+        writer.clauses (encoded[i])
+      else:
+        writer.clause (lits[offsets[i]:offsets[i+1]])
 
 # 4. Write the SAT problem as a CNF, encoding cardinality constraints with the 
 # specified encoding type and the new literal ordering
-def write_cnf (klauses, var_map, max_var, cnf_output, encoding_type, rename):
-  clauses = []
-  # loop over input KNF formula, replacing cardinality constraints with encoded clauses
-  for (bound, literals) in klauses:
-    if bound > 1: # cardinality constraint
-      if rename:
-        shuffled_literals = sort_literals(literals, list(range(0,max_var+1)))
-      else:
-        # shuffle literals inside the cardinality consrtaint based on new ordering
-        shuffled_literals = sort_literals (literals, var_map)
+def write_cnf (formula, var_map, max_var, cnf_output, encoding_type, rename):
+  check_encoding (encoding_type)
 
-      # if localMAC:
-      #   print(shuffled_literals)
+  if rename:
+    var_map = range(0,max_var+1)
 
+  # encode the cardinality constraints first so the header (number of clauses
+  # and largest aux variable) is known before streaming the formula
+  encoded = {}
+  num_cls = 0
+  for i in range(len(formula)):
+    if formula.kinds[i] == AMO: continue
+    bound = formula.bounds[i]
 
-      # encode using the specific encoding type from PySAT
-      if encoding_type == "original_cardinality":
-        clauses.append (["k",str(bound)] + shuffled_literals)
-      else:
-        new_cnf = None
-        if encoding_type == "seqcounter":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.seqcounter) 
-        elif encoding_type == "totalizer":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.totalizer)
-        elif encoding_type == "sortnetwrk":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.sortnetwrk)
-        elif encoding_type == "cardnetwrk":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.cardnetwrk)
-        elif encoding_type == "mtotalizer":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.mtotalizer)
-        elif encoding_type == "kmtotalizer":
-          new_cnf = CardEnc.atleast(shuffled_literals, bound, max_var,encoding=EncType.kmtotalizer)
-        else:
-          print(f"Error: encoding type {encoding_type} not recognized")
-          exit()
-
-        # Update max variable based on largest aux variable used in the encoding
-        max_var = max([max([abs(l) for l in lits]) for lits in new_cnf.clauses])
-        clauses = clauses + new_cnf.clauses
+    if bound > 1: # cardinality constraint
+      # shuffle literals inside the cardinality consrtaint based on new ordering
+      shuffled_literals = sort_literals (formula.literals(i), var_map)
+      encoded[i], max_var = encode_cardinality (shuffled_literals, bound, max_var, encoding_type)
+      num_cls += len(encoded[i])
 
     else: # standard clause
-      clauses.append(literals)
+      num_cls += 1
 
   # write the output CNF formula
-  out_file = open(cnf_output, 'w')
+  stream_cnf (formula, encoded, max_var, num_cls, cnf_output, encoding_type)
 
-  # header  
-  if encoding_type == "original_cardinality":
-    out_file.write("p knf "+str(max_var)+" "+str(len(clauses))+"\n")
-  else:
-    out_file.write("p cnf "+str(max_var)+" "+str(len(clauses))+"\n")
+# output file for one bound in paired mode: out.cnf -> out-k<bound>.cnf,
+# out.cnf.gz -> out-k<bound>.cnf.gz
+def bound_output (cnf_output, bound):
+  plain = strip_compression (cnf_output)
+  root, ext = os.path.splitext(plain)
+  return root + "-k" + str(bound) + ext + cnf_output[len(plain):]
 
-  for clause in clauses:
-     write_clause (out_file, clause)
+'''
+Paired mode, write one CNF per bound of the single cardinality constraint
+(e.g. the -sat and -unsat bound of a benchmark) from one parse and one ordering.
 
-  out_file.close()
+With the totalizer encoding the tree is built once with PySAT's incremental
+totalizer up to the smallest bound, and the CNFs differ only in the unit clause
+on the tree output. Other encodings are rebuilt for each bound.
+'''
+def write_cnf_bounds (formula, var_map, max_var, cnf_output, encoding_type, rename, bounds):
+  check_encoding (encoding_type)
+
+  if rename:
+    var_map = range(0,max_var+1)
+
+  cards = formula.indices (CARD)
+  if len(cards) != 1:
+    print(f"Error: paired mode needs exactly one cardinality constraint, found {len(cards)}")
+    exit()
+  card = cards[0]
+
+  shuffled_literals = sort_literals (formula.literals(card), var_map)
+  n = len(shuffled_literals)
+  if min(bounds) < 1 or max(bounds) > n:
+    print(f"Error: bounds must be between 1 and {n}")
+    exit()
+
+  num_hard = sum(1 for i in range(len(formula)) if formula.kinds[i] != AMO) - 1
+
+  tree = None
+  if encoding_type == "totalizer":
+    # at least b of the literals == at most n-b of the negated literals
+    tree = ITotalizer(lits=[-l for l in shuffled_literals], ubound=max(1, n - min(bounds)), top_id=max_var)
+
+  for bound in bounds:
+    if tree is not None:
+      clauses = chain(tree.cnf.clauses, [[-tree.rhs[n - bound]]])
+      num_cls = num_hard + len(tree.cnf.clauses) + 1
+      top = max(max_var, tree.top_id)
+    else:
+      clauses, top = encode_cardinality (shuffled_literals, bound, max_var, encoding_type)
+      num_cls = num_hard + len(clauses)
+
+    stream_cnf (formula, {card: clauses}, top, num_cls, bound_output(cnf_output, bound), encoding_type)
+
+  if tree is not None:
+    tree.delete()
 
 
 '''
@@ -281,11 +212,11 @@ Writing MaxSAT problem, not used in AAAI paper
 
 Assuming the one big cardinality constraint is actually all of the soft clauses
 '''
-def write_wcnf (klauses, var_map, max_var, cnf_output):
+def write_wcnf (formula, var_map, max_var, cnf_output):
   clauses = []
   soft_units = []
   # loop over input KNF formula, replacing cardinality constraints with encoded clauses
-  for (bound, literals) in klauses:
+  for (bound, literals) in formula.klauses():
     if bound > 1: # cardinality constraint
       for l in literals:
         soft_units.append(l)
@@ -294,7 +225,7 @@ def write_wcnf (klauses, var_map, max_var, cnf_output):
       clauses.append(literals)
 
   # write the output CNF formula
-  out_file = open(cnf_output, 'w')
+  out_file = open_output(cnf_output)
 
   soft_units.sort()
   for l in soft_units:
@@ -309,120 +240,55 @@ def write_wcnf (klauses, var_map, max_var, cnf_output):
 
   Encode into CNF or calculate coverage statistic
 '''
-def generate_cnf (knf_input, cnf_output, encoding_type, variable_ordering_type, random_seed, rename, maxSAT_out, bias_change,  occLimit, tempOrdered, get_coverage, temp_order_file):
+def generate_cnf (knf_input, cnf_output, encoding_type, variable_ordering_type, random_seed, rename, maxSAT_out, bias_change,  occLimit, tempOrdered, get_coverage, temp_order_file, cache_dir=None, bounds=None, coverage_format="tikz", time_limit=None):
+
+  # wall-clock budget (-l) of the parse and the ordering, past the deadline the
+  # ordering returns its best partial result
+  deadline = None if time_limit is None else time.time() + time_limit
 
   # set random seed
   random.seed(random_seed)
 
-  # open knf formula (likely zipped with xz)
-  knf_lines = None
-
-  ## if needing to unzip
-  # if (knf_input.endswith('.xz')):
-  #   knf_lines = lzma.open(knf_input, mode='rt', encoding='utf-8')
-  # else:
+  # 1. Parse the KNF once, every later stage reuses the parsed formula
 
-  knf_lines = open(knf_input, 'r')
+  formula = parse_knf (knf_input)
 
+  max_var = formula.max_var  # max variables used to set new auxiliary variables in encodings
 
-  clauses = [] # clauses (list of list of literals)
-  max_var = None  # max variables used to set new auxiliary variables in encodings
-  max_cls = None
+  # 2. Get the variable ordering from the ordering registry,
+  #  var_map should map all variables up to max_var to their rank
 
-  # get number of variables from header for 
-  for line in knf_lines:
-    line = trim(line)
-    tokens = line.split()
+  start = time.time()
 
-    if tokens[0] == "p": # pcnf header
-      max_var = int(tokens[2])
-      max_cls = int(tokens[3])
-      break
-  knf_lines.close()
-
-  # set ordering for variables
-  #  should map all variables up to max_var
-  var_map = []
-
-  # 2. Get the variable ordering, calling a separate script for more complex orderings
-  
   if tempOrdered is not None:
     # Option to pass the ordering in directly via a file
     # Not used in AAAI paper
-    for i in range(max_var+1):
-      var_map.append(i)
+    var_map = parse_ordering (tempOrdered, max_var)
 
-    var_map = parse_ordering (tempOrdered, var_map, max_var)
+  else:
+    if variable_ordering_type == "auto":
+      # configuration with the best predicted total time (cost_model.py)
+      configuration = choose_ordering (formula, encoding_type, deadline=deadline)
+      print("Auto ordering " + configuration)
+      variable_ordering_type, random_seed, occLimit = resolve_ordering_type (configuration, random_seed, occLimit)
 
-  elif variable_ordering_type == "natural":
-    # Every variable is mapped to itself, order by variable names
-    for i in range(max_var+1):
-      var_map.append(i)
+    var_map = compute_ordering (formula, variable_ordering_type, random_seed, occLimit, cache_dir, deadline)
 
-  elif variable_ordering_type == "random_fixed":
-    # basic random map
-    for i in range(1,max_var+1):
-      var_map.append(i)
-    
-    random.shuffle (var_map)
-
-    # shift right one because zero is not a variable index
-    var_map.insert(0,0)
-  
-  else:
-    cmd = None # command to call for ordering script
-    if variable_ordering_type == "graph":
-      # call script that performs the community detection algorithm
-      occ_script = "tools/VIG_ordering.py "
-      cmd = ("python3 "+occ_script+" "+knf_input+" > " + temp_order_file)
-
-    elif variable_ordering_type == "graphOcc":
-      # call script that performs the community detection algorithm
-      # with additional argument not used in AAAI paper
-      occ_script = "tools/VIG_ordering.py "
-      cmd = ("python3 "+occ_script+" "+knf_input+" -s > " + temp_order_file)
-
-    elif variable_ordering_type == "occurence" or (occLimit > 0 and max_cls >= occLimit):
-      # Call script that performs the occurence ordering algorithm.
-      # Could count this locally but we kept it a separate script for consistency.
-      occ_script = "tools/occur_ordering.py"
-      cmd =  ("python3 "+occ_script+" -k "+knf_input+" > " + temp_order_file)
-
-    elif variable_ordering_type == "proximity":
-      # Call script that performs the proximity ordering algorithm.
-      occ_script = "./tools/proximity/proximity"
-      cmd = occ_script+" "+knf_input+" > " + temp_order_file
-
-    elif variable_ordering_type == "PAMO":
-      # Call script that performs the proximity ordering algorithm with AMO detection
-      occ_script = "sh tools/PAMO.sh"
-      cmd = occ_script+" "+knf_input+" " + temp_order_file
-
-    if cmd is not None:
-      os.system (cmd)
-
-      for i in range(max_var+1):
-        var_map.append(i)
-
-      var_map = parse_ordering (temp_order_file, var_map, max_var)
-    else:
-      print(f"Error: variable ordering {variable_ordering_type} not recognized")
-      exit()
+  order_time = time.time() - start
 
+  if temp_order_file is not None:
+    write_ordering (temp_order_file, var_map, max_var)
 
   # print out ordering for comparative purposes...
-  shuffled_all = sort_literals (list(range(1,max_var+1)), var_map)
+  shuffled_all = order_from_ranks (var_map, max_var)
   # if encoding_type == "kmtotalizer":
   print("Variable Order " + str(shuffled_all))
 
-  # parse the KNF
-  input_klauses, soft_units = parse_knf (knf_input)
+  soft_units = formula.soft_units ()
 
   if get_coverage:
     # get the coverage statistics for an ordering then exit
-    clauses, occs = parse_knf_remove_soft (knf_input, soft_units)
-    lst = ["occurence", "proximity" ,"PAMO", "natural", "graph"]
-    print_coverage (var_map, soft_units, clauses, occs, max_var, lst.index(variable_ordering_type))
+    print_coverage (formula, var_map, soft_units, variable_ordering_type, coverage_format, order_time)
 
     exit ()
 
@@ -431,28 +297,18 @@ def generate_cnf (knf_input, cnf_output, encoding_type, variable_ordering_type,
     # rename only soft units, not other variables.
     # Not used in AAAI paper.
 
-    soft_units = list(dict.fromkeys(soft_units)) # remove duplicates for renaming
-    soft_units.sort()
-    sorted_units = sort_literals (soft_units, var_map)
-    is_soft = [0] * (max_var+1)
-    for l in sorted_units:
-      is_soft[abs(l)] = 1
-
-    for i in range(max_var+1):
-      if is_soft[i] == 1:
-        var_map[i] =  soft_units[sorted_units.index(i)] #  sorted_units[soft_units.index(i)]
-      else:
-        var_map[i] = i
-    klauses = rename_knf (input_klauses, var_map, max_var)
-  else:
-    klauses = input_klauses
-  # klauses kept in order for backwards compatibility
+    var_map = soft_renaming (soft_units, var_map, max_var)
+    formula = formula.renamed (var_map)
+  # constraints kept in order for backwards compatibility
 
   # output CNF or MaxSAT
   if maxSAT_out: # Not used in AAAI paper
-    write_wcnf (klauses, var_map, max_var, cnf_output)
+    write_wcnf (formula, var_map, max_var, cnf_output)
+  elif cnf_output is not None and bounds is not None:
+    # paired mode, one CNF per bound
+    write_cnf_bounds (formula, var_map, max_var, cnf_output, encoding_type, rename, bounds)
   elif cnf_output is not None:
-    write_cnf (klauses, var_map, max_var, cnf_output, encoding_type, rename)
+    write_cnf (formula, var_map, max_var, cnf_output, encoding_type, rename)
   
     
 def run(name, args):
@@ -471,11 +327,23 @@ def run(name, args):
     
     get_coverage = False
     
-    temp_order_file = "temp.ord"
+    temp_order_file = None
+
+    # cache directory for computed orderings (-d), off by default
+    cache_dir = os.environ.get("ORDERING_CACHE_DIR")
+
+    # paired mode (-p), comma separated bounds for the cardinality constraint
+    bounds = None
+
+    # coverage output (-f), tikz, json or csv
+    coverage_format = "tikz"
+
+    # time limit in seconds (-l) for the parse and the ordering, off by default
+    time_limit = None
 
     bias_change = "0"
 
-    optlist, args = getopt.getopt(args, "zrmk:c:e:v:s:b:o:t:q:")
+    optlist, args = getopt.getopt(args, "zrmk:c:e:v:s:b:o:t:q:d:p:f:l:")
     for (opt, val) in optlist:
         if opt == '-k':
             knf_input = val
@@ -501,16 +369,22 @@ def run(name, args):
           get_coverage = True
         elif opt == '-q':
           temp_order_file = val
-
-    if variable_ordering_type == "PAMO+Occur":
-      variable_ordering_type = "PAMO"
-      occLimit = 1000000 # set to one million before switching to Occur
-    
-    if "random_fixed" in variable_ordering_type:
-      random_seed = int(variable_ordering_type[13:])
-      variable_ordering_type = "random_fixed"
+        elif opt == '-d':
+          cache_dir = val
+        elif opt == '-p':
+          bounds = [int(b) for b in val.split(",")]
+        elif opt == '-f':
+          coverage_format = val
+        elif opt == '-l':
+          time_limit = float(val)
+
+    variable_ordering_type, random_seed, occLimit = resolve_ordering_type (variable_ordering_type, random_seed, occLimit)
       
-    generate_cnf (knf_input, cnf_output, encoding_type, variable_ordering_type, random_seed, rename, maxSAT_out, bias_change, occLimit, tempORDERED, get_coverage, temp_order_file)
+    try:
+      generate_cnf (knf_input, cnf_output, encoding_type, variable_ordering_type, random_seed, rename, maxSAT_out, bias_change, occLimit, tempORDERED, get_coverage, temp_order_file, cache_dir, bounds, coverage_format, time_limit)
+    except ValueError as e:
+      print("Error: " + str(e))
+      sys.exit(1)
     
 if __name__ == "__main__":
     run(sys.argv[0], sys.argv[1:])
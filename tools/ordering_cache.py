@@ -0,0 +1,129 @@
+import hashlib
+import os
+import tempfile
+import time
+from array import array
+from ranks import PartialRanks
+
+
+'''
+Content-addressed on-disk cache for computed orderings.
+
+An entry is the rank array of an ordering, stored as raw int32 values in
+<cache_dir>/<key>.ord. The key is a hash of
+
+  - the formula digest, ignoring the cardinality bound unless the ordering uses it
+    (the -sat/-unsat pair of a benchmark share one entry),
+  - the ordering name and its parameters,
+  - the version of the ordering tools (CACHE_VERSION).
+
+Entries are written to a temporary file then renamed, so concurrent jobs can
+share a cache directory. The cache is bounded in size, the least recently used
+entries (by file modification time, refreshed on every hit) are evicted first.
+The intermediate results the orderings keep under <cache_dir>/vig (graphs and
+communities) and <cache_dir>/amo (detected AMO constraints) count towards the
+bound and are evicted the same way.
+
+  cache = OrderingCache (cache_dir)
+  var_map = cache.get_or_compute (formula, "PAMO", {}, lambda: pamo (formula))
+'''
+
+# bump when an ordering implementation changes its output
+CACHE_VERSION = 5
+
+MAX_CACHE_BYTES = 1 << 30
+
+# evicted files, subdirectory -> suffix (orderings, graph orderings, PAMODirect)
+CACHE_FILES = {"": ".ord", "vig": ".npz", "amo": ".amo"}
+
+# orderings whose result depends on the cardinality bounds
+BOUND_DEPENDENT = ["occurence", "occurencePolarity", "occurenceJW"]
+
+
+class OrderingCache:
+
+  def __init__ (self, cache_dir, max_bytes=MAX_CACHE_BYTES):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def key (self, formula, name, options):
+    h = hashlib.sha256()
+    h.update(formula.digest(ignore_bounds=(name not in BOUND_DEPENDENT)).encode())
+    h.update(name.encode())
+    h.update(repr(sorted(options.items())).encode())
+    h.update(str(CACHE_VERSION).encode())
+    return h.hexdigest()
+
+  def path (self, key):
+    return os.path.join(self.cache_dir, key + ".ord")
+
+  # rank array stored under key, None on a miss or a corrupt entry
+  def get (self, key, max_var):
+    path = self.path(key)
+    try:
+      with open(path, 'rb') as f:
+        data = f.read()
+    except OSError:
+      return None
+
+    ranks = array('i')
+    if len(data) != ranks.itemsize * (max_var+1):
+      return None
+    ranks.frombytes(data)
+
+    # refresh the entry for the LRU eviction
+    try:
+      os.utime(path)
+    except OSError:
+      pass
+    return ranks
+
+  def put (self, key, ranks):
+    ranks = array('i', ranks)
+    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+    with os.fdopen(fd, 'wb') as f:
+      f.write(ranks.tobytes())
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, self.path(key))
+    self.evict()
+
+  # remove least recently used entries (orderings and intermediate results)
+  # until the cache fits in max_bytes
+  def evict (self):
+    entries = []
+    for (subdir, suffix) in CACHE_FILES.items():
+      directory = os.path.join(self.cache_dir, subdir)
+      try:
+        names = os.listdir(directory)
+      except OSError:
+        continue
+      for name in names:
+        if not name.endswith(suffix): continue
+        path = os.path.join(directory, name)
+        try:
+          st = os.stat(path)
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for (_, size, _) in entries)
+    entries.sort()
+    for (_, size, path) in entries:
+      if total <= self.max_bytes: break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      total -= size
+
+  # an ordering that returned after its deadline may be partial, it is not stored
+  def get_or_compute (self, formula, name, options, compute, deadline=None):
+    key = self.key(formula, name, options)
+    ranks = self.get(key, formula.max_var)
+    if ranks is None:
+      ranks = compute()
+      # an ordering cut short would be served to runs without a deadline
+      if not isinstance(ranks, PartialRanks) and (deadline is None or time.time() <= deadline):
+        self.put(key, ranks)
+    return ranks
@@ -0,0 +1,267 @@
+import os
+import random
+import subprocess
+import tempfile
+import time
+from array import array
+
+import amo_cliques
+import occur_ordering
+import proximity_ordering
+from ranks import ranks_from_order, partial_ranks, PartialRanks
+from knf import parse_knf_lines
+from ordering_cache import OrderingCache
+from compressed_io import decompressed_path
+
+
+'''
+Registry of variable orderings used by order_and_encode.py
+
+Every ordering is a callable
+
+  ordering (formula, **options) -> rank array
+
+taking the parsed KnfFormula and returning the ranks in memory,
+rank[v] is the position of variable v in the ordering (rank[0] = 0).
+The smaller the rank, the closer to the front of the cardinality constraint.
+
+options may hold cache_dir, the ordering cache directory, where an ordering
+can keep its own intermediate results, deadline, a time.time() value, and
+jobs, the number of Louvain worker processes of the graph orderings (inside
+the worker processes of batch_preprocess.py and coverage.py the seeds run one
+after another).
+Past the deadline an ordering returns its best partial result: proximity and
+the PAMO orderings append the soft variables not ordered yet by occurrence, the graph
+orderings use the Louvain seeds run so far. The other orderings are immediate.
+A result cut short by the deadline in any stage (e.g. the AMO detection of
+PAMODirect) is returned as a PartialRanks (ranks.py) and is not stored in the
+ordering cache. The budgets of the configurations themselves (the 25 s AMO
+detection, the 300 s Louvain timeout) are not cuts.
+
+Orderings run in-process on the parsed formula. PAMO calls the amo_detect
+binary, the AMO constraints are read from its stdout while it runs and scored
+by the in-process proximity engine, nothing is written to disk.
+
+New orderings are added with the register decorator,
+
+  @register("my_ordering")
+  def my_ordering (formula, **options):
+    ...
+'''
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TOOLS_DIR)
+
+ORDERINGS = {}
+
+def register (name):
+  def add (ordering):
+    ORDERINGS[name] = ordering
+    return ordering
+  return add
+
+def get_ordering (name):
+  return ORDERINGS.get(name)
+
+# Raise ValueError for a name that is not a registered ordering (raised rather
+# than exiting, so a bad name also fails the worker processes cleanly)
+def check_ordering (name):
+  if get_ordering (name) is None:
+    raise ValueError(f"variable ordering {name} not recognized")
+
+# orderings cheaper to recompute than to load from the cache
+UNCACHED_ORDERINGS = ["natural", "random_fixed"]
+
+# community detection orderings, the Louvain seeds that start before the
+# timeout depend on the number of processes running them
+GRAPH_ORDERINGS = ["graph", "graphOcc", "graphEarly", "graphStar", "graphSoft"]
+
+# Split the configuration names accepted by -v into (ordering, seed, occLimit)
+def resolve_ordering_type (variable_ordering_type, random_seed=0, occLimit=-1):
+  if variable_ordering_type in ["PAMO+Occur", "PAMODirect+Occur"]:
+    variable_ordering_type = variable_ordering_type[:-len("+Occur")]
+    occLimit = 1000000 # set to one million before switching to Occur
+
+  if "random_fixed" in variable_ordering_type:
+    random_seed = int(variable_ordering_type[13:])
+    variable_ordering_type = "random_fixed"
+
+  return variable_ordering_type, random_seed, occLimit
+
+# Get the rank array of an ordering from the registry (or the ordering cache)
+def compute_ordering (formula, variable_ordering_type, random_seed, occLimit, cache_dir=None, deadline=None):
+  check_ordering (variable_ordering_type)
+
+  ordering_name = variable_ordering_type
+  if ordering_name in ["proximity", "PAMO", "PAMODirect"] and occLimit > 0 and formula.num_cls >= occLimit:
+    # switch to the cheaper occurence ordering for large formulas
+    ordering_name = "occurence"
+
+  ordering = get_ordering (ordering_name)
+
+  options = {}
+  if ordering_name == "random_fixed":
+    options["seed"] = random_seed
+  if ordering_name in GRAPH_ORDERINGS:
+    # part of the cache key
+    import VIG_ordering
+    options["jobs"] = VIG_ordering.seed_jobs(VIG_ordering.GRAPH_JOBS)
+
+  if cache_dir is not None and ordering_name not in UNCACHED_ORDERINGS:
+    # reuse an ordering computed for the same formula (ignoring the bound)
+    cache = OrderingCache (cache_dir)
+    return cache.get_or_compute (formula, ordering_name, options,
+                                 lambda: ordering (formula, cache_dir=cache_dir, deadline=deadline, **options), deadline)
+
+  return ordering (formula, cache_dir=cache_dir, deadline=deadline, **options)
+
+def formula_path (formula, name):
+  if formula.path is None:
+    raise ValueError(f"{name} ordering needs the formula file for the external binary")
+  return os.path.abspath(formula.path)
+
+
+# Every variable is mapped to itself, order by variable names
+@register("natural")
+def natural (formula, **options):
+  return array('i', range(formula.max_var+1))
+
+# basic random map, seeded for reproducibility
+@register("random_fixed")
+def random_fixed (formula, seed=0, **options):
+  ranks = list(range(1, formula.max_var+1))
+  random.Random(seed).shuffle(ranks)
+
+  # shift right one because zero is not a variable index
+  return array('i', [0] + ranks)
+
+@register("occurence")
+def occurence (formula, **options):
+  return occur_ordering.occurrence_ranks(formula)
+
+# most frequent polarity first
+@register("occurencePolarity")
+def occurence_polarity (formula, **options):
+  return occur_ordering.occurrence_ranks(formula, "polarity")
+
+# Jeroslow-Wang weighting, short clauses count more
+@register("occurenceJW")
+def occurence_jw (formula, **options):
+  return occur_ordering.occurrence_ranks(formula, "jw")
+
+def graph_ranks (formula, sort_variables, options, **graph_options):
+  # networkx is only needed for the graph orderings
+  import VIG_ordering
+
+  # graph and communities are shared by graph and graphOcc (and the sat/unsat pair)
+  cache_dir = options.get("cache_dir")
+  if cache_dir is not None:
+    cache_dir = os.path.join(cache_dir, "vig")
+
+  # the seeds run on option jobs processes (GRAPH_JOBS by default), a search
+  # cut by the deadline is returned as partial, so it is not cached
+  best_group = VIG_ordering.community_groups(formula, sort_variables=sort_variables, jobs=options.get("jobs", VIG_ordering.GRAPH_JOBS),
+                                             cache_dir=cache_dir, deadline=options.get("deadline"), **graph_options)
+  literals = VIG_ordering.cardinality_literals(formula, best_group)
+  return partial_ranks(ranks_from_order(literals[0], formula.max_var), isinstance(best_group, VIG_ordering.PartialGroups))
+
+# community detection on the variable incidence graph
+@register("graph")
+def graph (formula, **options):
+  return graph_ranks(formula, False, options)
+
+# community detection, variables sorted by occurrence inside each community
+# Not used in AAAI paper
+@register("graphOcc")
+def graph_occ (formula, **options):
+  return graph_ranks(formula, True, options)
+
+# the Louvain seeds of graphEarly stop after this many seeds in a row without
+# more communities or a lower group deviation
+GRAPH_PATIENCE = 10
+
+# community detection that stops the Louvain seeds early, graph runs all of them
+# as in the AAAI paper
+@register("graphEarly")
+def graph_early (formula, **options):
+  return graph_ranks(formula, False, options, patience=GRAPH_PATIENCE)
+
+# clauses longer than this are a star around a hub node in graphStar
+STAR_MAX_CLIQUE = 16
+
+# community detection on a VIG growing linearly with the formula, long clauses
+# are stars and clique edges decay with the clause length
+@register("graphStar")
+def graph_star (formula, **options):
+  return graph_ranks(formula, False, options, max_clique=STAR_MAX_CLIQUE, decay=True)
+
+# the soft variables are clustered within their 1-hop neighbourhood, the other
+# neighbours of that neighbourhood are kept as boundary nodes
+SOFT_HOPS = 1
+
+# community detection on the neighbourhood of the soft variables only
+@register("graphSoft")
+def graph_soft (formula, **options):
+  return graph_ranks(formula, False, options, soft_hops=SOFT_HOPS, project=True)
+
+# same ordering as the proximity binary, computed on the parsed formula
+@register("proximity")
+def proximity (formula, deadline=None, **options):
+  return proximity_ordering.proximity_ranks(formula, deadline=deadline)
+
+# detection budget of PAMO and PAMODirect, as the -Direct_timeout of amo_detect in PAMO.sh
+AMO_DETECT_TIMEOUT = 25
+
+# Time left for each AMO detection engine, at most half of what is left before
+# the deadline (shared by the engines) so proximity gets the other half
+def detection_budget (deadline, engines=1):
+  if deadline is None:
+    return AMO_DETECT_TIMEOUT
+  return max(0.0, min(AMO_DETECT_TIMEOUT, (deadline - time.time()) / (2 * engines)))
+
+# proximity with the direct AMO constraints of the binary clauses only, detected
+# in-process (and kept in <cache_dir>/amo) and scored as if appended to the
+# formula. No compiled binary needed, but not the PAMO of the AAAI paper, which
+# also detects encoded AMO constraints.
+@register("PAMODirect")
+def pamo_direct (formula, cache_dir=None, deadline=None, **options):
+  if cache_dir is not None:
+    cache_dir = os.path.join(cache_dir, "amo")
+  budget = detection_budget (deadline)
+  detection_deadline = time.time() + budget
+  amos = amo_cliques.cached_amos(formula, cache_dir, detection_deadline)
+  # a detection cut by the deadline misses constraints, the 25 s budget of
+  # the configuration itself is not a cut
+  cut = budget < AMO_DETECT_TIMEOUT and time.time() > detection_deadline
+  ranks = proximity_ordering.proximity_ranks(formula, amos, deadline)
+  return partial_ranks(ranks, cut or isinstance(ranks, PartialRanks))
+
+AMO_DETECT = os.path.join(TOOLS_DIR, "AMO_detection", "amo_detect")
+
+# AMO detection of PAMO, same options as tools/PAMO.sh
+# (the direct and the encoded detection get timeout seconds each)
+def amo_detect_command (timeout):
+  return [AMO_DETECT, "--Quick_Write=true", "--Direct_AMO_Small=false",
+          "-Direct_timeout", str(timeout), "-Encoded_timeout", str(timeout)]
+
+# AMO constraints found by amo_detect, parsed from its stdout as they are printed.
+# A compressed formula is inflated into a temporary workspace for the binary.
+# As in PAMO.sh, the constraints printed before a detector failure are still used.
+def binary_amos (formula, timeout=AMO_DETECT_TIMEOUT):
+  if not os.path.exists(AMO_DETECT):
+    raise ValueError("amo_detect not built, run tools/AMO_detection/build.sh")
+  with tempfile.TemporaryDirectory(prefix="PAMO.") as work_dir:
+    knf_path = decompressed_path (formula_path (formula, "PAMO"), work_dir)
+    with subprocess.Popen(amo_detect_command (timeout) + [knf_path], cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True) as detector:
+      return parse_knf_lines(line for line in detector.stdout if line.startswith("m"))
+
+# proximity with the direct and encoded AMO constraints of amo_detect,
+# same ordering as tools/PAMO.sh (the AAAI paper configuration)
+@register("PAMO")
+def pamo (formula, deadline=None, **options):
+  # amo_detect takes a timeout > 0, a zero timeout means its default (1000 s)
+  timeout = max(0.01, detection_budget (deadline, engines=2))
+  ranks = proximity_ordering.proximity_ranks(formula, binary_amos(formula, timeout), deadline)
+  # the binary does not tell whether a detection was cut, so the ordering counts
+  # as partial when the deadline left the engines less than their 25 s
+  return partial_ranks(ranks, timeout < AMO_DETECT_TIMEOUT or isinstance(ranks, PartialRanks))
@@ -0,0 +1,278 @@
+import sys
+import getopt
+import heapq
+import time
+from array import array
+from knf import parse_knf, CLAUSE, CARD, AMO
+from ranks import ranks_from_order, partial_ranks
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+This script parses a KNF formula and returns a variable ordering by
+
+  1. Parsing the KNF
+  2. Computing the proximity algorithm (AAAI paper)
+  3. Printing the ordering
+
+In-process version of tools/proximity/proximity, giving the same ordering.
+
+Proximity algorithm,
+
+  Starting from the soft variable with the most clause occurrences, the next
+  variable is the unprocessed variable with the highest score. Processing a
+  variable adds to the score of every variable sharing a constraint with it,
+
+    binary clause   4
+    other clause    1/len(C)
+    AMO constraint  len(K)^2   (only AMO constraints with bound > 4)
+
+  A variable seen for the first time gets a small bias (increasing with every
+  new variable) subtracted from its score, so ties favour older variables.
+  When no scored variable is left, the next variable is again the unprocessed
+  soft variable with the most clause occurrences. The algorithm stops once all
+  soft variables (variables of the first cardinality constraint) are ordered.
+
+The binary scans all scored variables for the maximum at every step. Here the
+scores are kept in a priority queue with lazy deletion, keyed by (score, first
+seen), an entry is skipped when its score is outdated. The constraints are
+reached through polarity occurrence lists (positive then negative) built once
+from the flat literal array, so a run is O(E log V).
+
+With a deadline (time.time() value), the ordering stops when the deadline is
+reached and the soft variables not ordered yet are appended by clause
+occurrences, most frequent first.
+
+Default Exuection:
+
+  > python3 proximity_ordering.py -k <KNF> > <ORDER>
+
+Note on modules,
+
+  numpy is optional, it is only used to build the occurrence lists
+'''
+
+# AMO constraints with a smaller bound are not scored
+AMO_MIN_BOUND = 5
+
+# tie breaking bias of a new variable, grows by this amount for every new variable
+ORDER_BIAS = 0.000001
+
+# Constraints used by proximity and their score, a k line with bound 1 is a clause.
+# Constraint ids run over the formula then the extra AMO constraints (amos).
+def scored_constraints (formula, amos=None):
+  parts = [formula] if amos is None else [formula, amos]
+
+  clauses = []
+  amo_ids = []
+  scores = [0.0] * sum(len(part) for part in parts)
+  soft = None
+  base = 0
+  for part in parts:
+    kinds = part.kinds
+    bounds = part.bounds
+    offsets = part.offsets
+    for i in range(len(part)):
+      size = offsets[i+1] - offsets[i]
+      if size == 0: continue
+      if kinds[i] == CLAUSE or (kinds[i] == CARD and bounds[i] == 1):
+        clauses.append(base + i)
+        scores[base + i] = float(size * size) if size == 2 else 1.0 / size
+      elif kinds[i] == CARD and bounds[i] > 1:
+        if soft is None: soft = base + i
+      elif kinds[i] == AMO and bounds[i] >= AMO_MIN_BOUND:
+        amo_ids.append(base + i)
+        scores[base + i] = float(size * size)
+    base += len(part)
+
+  # the binary stores the AMO constraint j as occurrence -j, so the first AMO
+  # constraint (-0) is read as the first clause, kept for identical orderings
+  alias = {}
+  if len(amo_ids) > 0 and len(clauses) > 0:
+    alias[amo_ids[0]] = clauses[0]
+
+  return clauses, amo_ids, scores, alias, soft
+
+# Occurrence lists of the literals, constraints of variable v are
+# occs[starts[2v]:starts[2v+1]] (positive) and occs[starts[2v+1]:starts[2v+2]] (negative),
+# in constraint order. Also returns the occurrence count of every variable in the clauses.
+def occurrence_lists (formula, amos, clauses, amo_ids, alias):
+  max_var = formula.max_var
+  parts = [formula] if amos is None else [formula, amos]
+
+  if np is not None:
+    used = np.sort(np.asarray(clauses + amo_ids, dtype=np.int64))
+    entry_lits = []
+    entry_ids = []
+    base = 0
+    for part in parts:
+      part_lits, part_offsets, _, _ = part.as_numpy()
+      ids = used[(used >= base) & (used < base + len(part))] - base
+      sizes = part_offsets[ids+1] - part_offsets[ids]
+      within = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+      entry_lits.append(part_lits[np.repeat(part_offsets[ids], sizes) + within])
+      entry_ids.append(np.repeat(ids + base, sizes))
+      base += len(part)
+    entry_lits = np.concatenate(entry_lits)
+    entry_ids = np.concatenate(entry_ids)
+    keys = 2 * np.abs(entry_lits).astype(np.int64) + (entry_lits < 0)
+
+    refs = entry_ids.copy()
+    for (c, target) in alias.items():
+      refs[entry_ids == c] = target
+    refs = refs[np.argsort(keys, kind='stable')]
+
+    starts = np.zeros(2 * max_var + 3, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=2 * max_var + 2), out=starts[1:])
+
+    in_clause = np.isin(entry_ids, clauses)
+    occ_count = np.bincount(np.abs(entry_lits[in_clause]), minlength=max_var + 1)
+    return array('q', starts.tobytes()), array('q', refs.tobytes()), occ_count.tolist()
+
+  lists = [[] for _ in range(2 * max_var + 2)]
+  occ_count = [0] * (max_var + 1)
+  is_clause = set(clauses)
+  is_used = is_clause | set(amo_ids)
+  base = 0
+  for part in parts:
+    for i in range(len(part)):
+      c = base + i
+      if c not in is_used: continue
+      ref = alias.get(c, c)
+      for l in part.lits[part.offsets[i]:part.offsets[i+1]]:
+        lists[2 * abs(l) + (l < 0)].append(ref)
+        if c in is_clause: occ_count[abs(l)] += 1
+    base += len(part)
+
+  starts = array('q', [0])
+  occs = array('q')
+  for lst in lists:
+    occs.extend(lst)
+    starts.append(len(occs))
+  return starts, occs, occ_count
+
+# Proximity ordering of the parsed formula, a list of variables ending with
+# the last soft variable (variables never reached are not listed). amos holds
+# extra AMO constraints (e.g. detected ones), scored as if appended to the formula.
+def proximity_order (formula, amos=None, deadline=None):
+  clauses, amo_ids, constraint_scores, alias, soft_constraint = scored_constraints (formula, amos)
+  if soft_constraint is None:
+    return []
+  starts, occs, occ_count = occurrence_lists (formula, amos, clauses, amo_ids, alias)
+
+  max_var = formula.max_var
+  lits = formula.lits
+  offsets = formula.offsets
+  # ids from split on are the extra AMO constraints
+  split = len(formula)
+  amo_lits = array('i') if amos is None else amos.lits
+  amo_offsets = array('q', [0]) if amos is None else amos.offsets
+
+  is_soft = bytearray(max_var + 1)
+  for l in lits[offsets[soft_constraint]:offsets[soft_constraint+1]]:
+    is_soft[abs(l)] = 1
+  soft = [v for v in range(1, max_var + 1) if is_soft[v]]
+  # fallback order, most clause occurrences first, smallest variable on ties
+  by_occur = sorted(soft, key=lambda v: -occ_count[v])
+  next_occur = 0
+
+  processed = bytearray(max_var + 1)  # 0 unseen, 1 scored, 2 ordered
+  scores = [0.0] * (max_var + 1)
+  first_seen = [0] * (max_var + 1)
+  heap = []
+  seen = 0
+  bias = ORDER_BIAS
+
+  remaining = len(soft)
+  order = []
+  while True:
+
+    if deadline is not None and time.time() > deadline:
+      # out of time, the other soft variables by occurrence
+      order.extend(v for v in by_occur[next_occur:] if processed[v] != 2)
+      break
+
+    # 1. Get next variable, highest score (first seen on ties)
+    v = 0
+    while heap:
+      neg_score, _, u = heapq.heappop(heap)
+      if processed[u] == 1 and -neg_score == scores[u]:
+        v = u
+        break
+
+    # no scored variable left, most occurrent soft variable
+    if v == 0:
+      while processed[by_occur[next_occur]]:
+        next_occur += 1
+      v = by_occur[next_occur]
+
+    # 2. Add to ordering
+    order.append(v)
+    processed[v] = 2
+
+    # 5. stop once all soft variables are ordered
+    if is_soft[v]:
+      remaining -= 1
+      if remaining == 0: break
+
+    # 3, 4. score the variables sharing a constraint, positive occurrences then negative
+    changed = set()
+    for c in occs[starts[2*v]:starts[2*v+2]]:
+      score = constraint_scores[c]
+      if c < split:
+        constraint = lits[offsets[c]:offsets[c+1]]
+      else:
+        constraint = amo_lits[amo_offsets[c-split]:amo_offsets[c-split+1]]
+      for l in constraint:
+        u = abs(l)
+        state = processed[u]
+        if state == 2: continue
+        if state == 0:
+          processed[u] = 1
+          first_seen[u] = seen
+          seen += 1
+          scores[u] += score - bias
+          bias += ORDER_BIAS
+        else:
+          scores[u] += score
+        changed.add(u)
+
+    for u in changed:
+      heapq.heappush(heap, (-scores[u], first_seen[u], u))
+
+  return order
+
+# a PartialRanks when the deadline cut the ordering
+def proximity_ranks (formula, amos=None, deadline=None):
+  ranks = ranks_from_order (proximity_order (formula, amos, deadline), formula.max_var)
+  return partial_ranks (ranks, deadline is not None and time.time() > deadline)
+
+def generate_proximity_ordering (knf_input):
+
+  # 1. Parse KNF formula
+  formula = parse_knf (knf_input)
+
+  # 2. Proximity
+  order = proximity_order (formula)
+
+  # 3. Print ordering
+  print(' '.join(str(v) for v in order) + " ")
+
+
+def run(name, args):
+
+    knf_input = None
+
+    optlist, args = getopt.getopt(args, "k:")
+    for (opt, val) in optlist:
+        if opt == '-k':
+            knf_input = val
+
+    generate_proximity_ordering (knf_input)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
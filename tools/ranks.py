@@ -0,0 +1,90 @@
+from array import array
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+'''
+Sorting and renaming with rank arrays.
+
+An ordering is stored as a rank array, ranks[v] is the position of variable v
+(ranks[0] = 0). The rank array is used directly as the sort key, with a stable
+vectorized argsort when numpy is available, so literals with the same rank keep
+their input order.
+
+An ordering cut short by its deadline returns a PartialRanks, a rank array
+like any other that the ordering cache does not store.
+
+Note on modules,
+
+  numpy is optional, without it the sorts fall back to sorted() with the rank as key
+'''
+
+# below this size the plain python sort is faster than converting to numpy
+NUMPY_MIN_SIZE = 1024
+
+def as_numpy_ranks (ranks):
+  if isinstance(ranks, array) and ranks.typecode == 'i':
+    return np.frombuffer(ranks, dtype=np.int32)
+  return np.asarray(ranks)
+
+# Rank array of an ordering cut short by its deadline (in any of its stages)
+class PartialRanks (array):
+  pass
+
+def partial_ranks (ranks, partial):
+  return PartialRanks('i', ranks) if partial else ranks
+
+# Convert an ordered list of variables (or literals) into a rank array,
+# variables that do not appear in the order keep their own index as rank
+def ranks_from_order (order, max_var):
+  ranks = array('i', range(max_var+1))
+  already_parsed = {}
+  cnt = 1
+
+  for l in order:
+    v = abs(l)
+
+    if v in already_parsed:
+      raise ValueError(f"variable {v} appears twice in the ordering")
+    else:
+      already_parsed[v] = 1
+
+    ranks[v] = cnt
+    cnt += 1
+
+  return ranks
+
+# sort the literals based on the positions in the rank array
+# the smaller the value, the closer to the front of the list
+# example: with map [1->3, 2->2, 3->1] and literals [1,2,3] return [3,2,1]
+def sort_literals (literals, ranks):
+  if np is not None and len(literals) >= NUMPY_MIN_SIZE:
+    lits = np.asarray(literals, dtype=np.int64)
+    keys = as_numpy_ranks(ranks)[np.abs(lits)]
+    return lits[np.argsort(keys, kind='stable')].tolist()
+
+  return sorted(literals, key=lambda l: ranks[abs(l)])
+
+# all variables 1..max_var in the order given by the rank array
+def order_from_ranks (ranks, max_var):
+  if np is not None and max_var >= NUMPY_MIN_SIZE:
+    keys = as_numpy_ranks(ranks)[1:max_var+1]
+    return (np.argsort(keys, kind='stable') + 1).tolist()
+
+  return sorted(range(1, max_var+1), key=ranks.__getitem__)
+
+# Rename only the soft units: the i-th soft unit in the ordering gets the
+# i-th smallest soft variable name, other variables keep their name.
+# Linear time through the inverse permutation.
+def soft_renaming (soft_units, ranks, max_var):
+  soft_units = sorted(set(soft_units))
+  sorted_units = sort_literals (soft_units, ranks)
+
+  var_map = array('i', range(max_var+1))
+  for (v, name) in zip(sorted_units, soft_units):
+    var_map[v] = name
+
+  return var_map
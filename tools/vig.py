@@ -0,0 +1,397 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from knf import CLAUSE
+
+
+'''
+Variable incidence graph (VIG) of a KNF formula in CSR form.
+
+Nodes are the variables 1..max_var, two variables are connected when they
+appear in a same standard clause (cardinality and AMO constraints are not
+part of the graph). The edges are generated from the flat literal array over
+windows of consecutive clauses, one vectorized step per distinct clause length.
+Each window is reduced to its unique edges with a sort and the windows are
+merged with one last sort, so the build is O(E log E) in the pairs E. The
+weight of an edge counts the clauses it comes from (weights accumulate on
+duplicate edges).
+
+Long clauses can be compressed into a star around an auxiliary hub node
+(max_clique), and the clique edges can decay with the clause length (decay),
+see clause_pairs. The graph can be restricted to the neighbourhood of a set of
+variables (neighbourhood, induced_subgraph), e.g. the soft variables.
+
+  indptr, indices : neighbours of v are indices[indptr[v]:indptr[v+1]]
+  weights         : weight of each entry (int32 clause counts, float64 with decay)
+  ranks           : rank (0 .. edges-1) of the edge of each entry, in order of first appearance
+
+The neighbours of a node are stored in order of first appearance, and
+to_networkx() adds the edges in that order, so the networkx graph (and the
+seeded Louvain communities) are the same as adding combinations(clause, 2)
+clause by clause.
+
+  vig = build_vig (formula)
+  G = vig.to_networkx ()
+
+Graph and community cache,
+
+  The VIG and the Louvain partitions can be stored as .npz files (CSR arrays,
+  one community label per node for each partition). Every file records its
+  key, a hash of the formula ignoring the cardinality bounds, of the graph and
+  Louvain parameters and of VIG_CACHE_VERSION. A file with another key is
+  ignored and overwritten, so the -sat/-unsat pair of a benchmark and reruns
+  share one entry.
+
+Note on modules,
+
+  numpy is required for the graph orderings, like networkx
+'''
+
+# bump when the graph or the community detection changes its output
+VIG_CACHE_VERSION = 3
+
+# edges added to the networkx graph at a time
+EDGE_CHUNK = 1 << 12
+
+class VIG:
+
+  def __init__ (self, num_nodes, indptr, indices, weights, ranks):
+    self.num_nodes = num_nodes  # nodes are 1..num_nodes, row 0 is empty
+    self.num_vars = num_nodes   # nodes above num_vars are the hubs of long clauses
+    self.nodes = None           # nodes of a subgraph, None for all of 1..num_nodes
+    self.indptr = indptr
+    self.indices = indices
+    self.weights = weights
+    self.ranks = ranks
+
+  def num_edges (self):
+    return len(self.edge_entries())
+
+  def neighbours (self, v):
+    return self.indices[self.indptr[v]:self.indptr[v+1]]
+
+  # row (source node) of every CSR entry
+  def rows (self):
+    return np.repeat(np.arange(len(self.indptr)-1), np.diff(self.indptr))
+
+  # CSR entries holding each undirected edge once (u <= v)
+  def edge_entries (self):
+    return np.flatnonzero(self.rows() <= self.indices)
+
+  # edge entries in order of first appearance (the ranks are 0 .. edges-1)
+  def ranked_entries (self):
+    entries = self.edge_entries()
+    ranked = np.empty_like(entries)
+    ranked[self.ranks[entries]] = entries
+    return ranked
+
+  # unique edges (u, v, weight) in order of first appearance
+  def edges (self):
+    entries = self.ranked_entries()
+    return self.rows()[entries], self.indices[entries], self.weights[entries]
+
+  # networkx graph for community detection, weighted or not. The edges are
+  # added EDGE_CHUNK at a time, so only the graph grows with the edges.
+  def to_networkx (self, weighted=False):
+    import networkx as nx
+
+    # one int object per node, shared by all the adjacency entries
+    node_objects = list(range(self.num_nodes + 1))
+    node = node_objects.__getitem__
+
+    G = nx.Graph()
+    if self.nodes is None:
+      G.add_nodes_from(node_objects[1:])
+    else:
+      G.add_nodes_from(map(node, self.nodes.tolist()))
+
+    # endpoints of the edges in rank order
+    rows = self.rows()
+    entries = rows <= self.indices
+    ranks = self.ranks[entries]
+    u = np.empty(len(ranks), dtype=np.int32)
+    u[ranks] = rows[entries]
+    del rows
+    v = np.empty(len(ranks), dtype=np.int32)
+    v[ranks] = self.indices[entries]
+    if weighted:
+      w = np.empty(len(ranks))
+      w[ranks] = self.weights[entries]
+    del entries, ranks
+
+    for c in range(0, len(u), EDGE_CHUNK):
+      edges = zip(map(node, u[c:c+EDGE_CHUNK].tolist()), map(node, v[c:c+EDGE_CHUNK].tolist()))
+      if weighted:
+        G.add_weighted_edges_from((a, b, x) for ((a, b), x) in zip(edges, w[c:c+EDGE_CHUNK].tolist()))
+      else:
+        G.add_edges_from(edges)
+    return G
+
+
+# Literals, with the start and size of every clause (clause order kept)
+def clause_literals (formula):
+  lits, offsets, _, kinds = formula.as_numpy()
+  clauses = np.flatnonzero(kinds == CLAUSE)
+  sizes = offsets[clauses+1] - offsets[clauses]
+  return lits, offsets[clauses], sizes
+
+# clause pairs merged into the graph at a time, bounds the temporary arrays
+PAIR_CHUNK = 1 << 18
+
+# All pairs (i < j) of every clause with their position in clause order, as chunks
+# (u, v, w, seq) over windows of consecutive clauses of about PAIR_CHUNK pairs.
+# Also returns the number of hub nodes.
+#
+# Clauses longer than max_clique are replaced by a star, a new hub node linked to
+# every variable of the clause, so the number of edges grows linearly with the
+# clause length. With decay, a clique edge of a clause of length k weighs 1/(k-1)
+# (every variable gets a total weight of 1 from the clause, as with the star edges).
+def clause_pairs (formula, max_clique=None, decay=False):
+  lits, starts, sizes = clause_literals(formula)
+
+  star = np.zeros(len(sizes), dtype=bool) if max_clique is None else sizes > max(max_clique, 2)
+  pair_counts = np.where(star, sizes, sizes * (sizes - 1) // 2)
+  pair_ends = np.cumsum(pair_counts)
+  pair_base = pair_ends - pair_counts
+  del pair_counts
+  # hub nodes are numbered after the variables, in clause order
+  hub_ids = formula.max_var + np.cumsum(star)
+
+  def chunks ():
+    first = 0
+    while first < len(sizes):
+      last = max(first + 1, int(np.searchsorted(pair_ends, pair_base[first] + PAIR_CHUNK, side='right')))
+      window = np.arange(first, last)
+      window_sizes = sizes[window]
+      window_star = star[window]
+      us, vs, ws, seqs = [], [], [], []
+
+      for k in np.unique(window_sizes[(window_sizes >= 2) & ~window_star]).tolist():
+        same = window[(window_sizes == k) & ~window_star]
+        clause_vars = np.abs(lits[starts[same][:, None] + np.arange(k)])
+        i, j = np.triu_indices(k, 1)
+        # pairs of a clause in combinations() order
+        seqs.append((pair_base[same][:, None] + np.arange(len(i))).ravel())
+        us.append(clause_vars[:, i].ravel())
+        vs.append(clause_vars[:, j].ravel())
+        ws.append(np.full(len(seqs[-1]), 1.0 / (k - 1) if decay else 1.0))
+
+      hubs = window[window_star]
+      if len(hubs) > 0:
+        hub_sizes = sizes[hubs]
+        within = np.arange(int(hub_sizes.sum())) - np.repeat(np.cumsum(hub_sizes) - hub_sizes, hub_sizes)
+        seqs.append(np.repeat(pair_base[hubs], hub_sizes) + within)
+        us.append(np.abs(lits[np.repeat(starts[hubs], hub_sizes) + within]))
+        vs.append(np.repeat(hub_ids[hubs], hub_sizes))
+        ws.append(np.ones(len(within)))
+
+      if len(seqs) > 0:
+        yield np.concatenate(us), np.concatenate(vs), np.concatenate(ws), np.concatenate(seqs)
+      first = last
+
+  return chunks(), int(star.sum())
+
+# Unique edges of keys, each with its first position and its summed weights
+# (summed in order of position)
+def unique_edges (keys, first, weights):
+  order = np.lexsort((first, keys))
+  keys = keys[order]
+  first = first[order]
+  weights = weights[order]
+  del order
+  group = np.empty(len(keys), dtype=bool)
+  group[:1] = True
+  np.not_equal(keys[1:], keys[:-1], out=group[1:])
+  weights = np.bincount(np.cumsum(group) - 1, weights=weights)
+  return keys[group], first[group], weights
+
+# CSR graph from the pair chunks of clause_pairs. Every chunk is reduced to its
+# unique edges on its own, then the chunks are merged with one more sort, each
+# edge keeps the position of its first appearance and sums its weights in clause
+# order (the chunks come in clause order). The neighbours of a node are stored
+# in order of first appearance of the edges.
+def csr_from_pairs (num_nodes, chunks, dtype=np.float64):
+  chunk_keys, chunk_first, chunk_weights = [], [], []
+  for (u, v, w, seq) in chunks:
+    u = u.astype(np.int64)
+    keys = np.minimum(u, v) * (num_nodes + 1) + np.maximum(u, v)
+    del u, v
+    keys, first, weights = unique_edges(keys, seq, w)
+    chunk_keys.append(keys)
+    chunk_first.append(first)
+    chunk_weights.append(weights)
+    del keys, first, weights, w, seq
+
+  keys = np.concatenate(chunk_keys) if chunk_keys else np.empty(0, dtype=np.int64)
+  first = np.concatenate(chunk_first) if chunk_first else np.empty(0, dtype=np.int64)
+  weights = np.concatenate(chunk_weights) if chunk_weights else np.empty(0)
+  del chunk_keys, chunk_first, chunk_weights
+  keys, first, weights = unique_edges(keys, first, weights)
+
+  # unique edges in order of first appearance, the rank of an edge is its index
+  by_rank = np.argsort(first, kind='stable')
+  del first
+  keys = keys[by_rank]
+  weights = weights[by_rank].astype(dtype)
+  del by_rank
+  num_edges = len(keys)
+
+  # both directions of every edge (once for a loop), in rank order
+  low = (keys // (num_nodes + 1)).astype(np.int32)
+  high = (keys % (num_nodes + 1)).astype(np.int32)
+  del keys
+  keep = np.ones(2 * num_edges, dtype=bool)
+  keep[1::2] = low != high
+  rows = np.empty(2 * num_edges, dtype=np.int32)
+  rows[0::2] = low
+  rows[1::2] = high
+  cols = np.empty(2 * num_edges, dtype=np.int32)
+  cols[0::2] = high
+  cols[1::2] = low
+  del low, high
+  rows = rows[keep]
+  cols = cols[keep]
+  weights = np.repeat(weights, 2)[keep]
+  ranks = np.repeat(np.arange(num_edges, dtype=np.int32), 2)[keep]
+  del keep
+
+  # stable, the entries of a row stay in rank order
+  order = np.argsort(rows, kind='stable')
+  indptr = np.zeros(num_nodes + 2, dtype=np.int64)
+  np.cumsum(np.bincount(rows, minlength=num_nodes + 1), out=indptr[1:])
+  del rows
+  cols = cols[order]
+  weights = weights[order]
+  ranks = ranks[order]
+  return VIG(num_nodes, indptr, cols, weights, ranks)
+
+def build_vig (formula, max_clique=None, decay=False):
+  chunks, num_hubs = clause_pairs(formula, max_clique, decay)
+  vig = csr_from_pairs(formula.max_var + num_hubs, chunks, np.float64 if decay else np.int32)
+  vig.num_vars = formula.max_var
+  return vig
+
+# Nodes within hops edges of the sources, as a mask over 0..num_nodes
+# (a hub node of a long clause counts as one hop)
+def neighbourhood (vig, sources, hops):
+  reached = np.zeros(vig.num_nodes + 1, dtype=bool)
+  frontier = np.unique(np.asarray(sources, dtype=np.int64))
+  reached[frontier] = True
+
+  for _ in range(hops):
+    starts = vig.indptr[frontier]
+    sizes = vig.indptr[frontier + 1] - starts
+    within = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    frontier = np.unique(vig.indices[np.repeat(starts, sizes) + within])
+    frontier = frontier[~reached[frontier]]
+    if len(frontier) == 0: break
+    reached[frontier] = True
+
+  return reached
+
+# Subgraph induced by the nodes in the keep mask. With project, the removed
+# nodes next to the kept ones stay as boundary nodes linked only to kept nodes,
+# so two kept nodes with a common removed neighbour remain connected through it
+# (like a hub) without adding a clique between them.
+def induced_subgraph (vig, keep, project=False):
+  rows = vig.rows()
+  if project:
+    boundary = np.zeros(vig.num_nodes + 1, dtype=bool)
+    boundary[vig.indices[keep[rows]]] = True
+    boundary &= ~keep
+    nodes = keep | boundary
+    entries = (keep[rows] & nodes[vig.indices]) | (boundary[rows] & keep[vig.indices])
+  else:
+    nodes = keep.copy()
+    entries = keep[rows] & keep[vig.indices]
+  nodes[0] = False
+
+  indptr = np.zeros(vig.num_nodes + 2, dtype=np.int64)
+  np.cumsum(np.bincount(rows[entries], minlength=vig.num_nodes + 1), out=indptr[1:])
+  # ranks of the remaining edges, renumbered from 0 in the same order
+  ranks = np.unique(vig.ranks[entries], return_inverse=True)[1].astype(np.int32)
+  sub = VIG(vig.num_nodes, indptr, vig.indices[entries], vig.weights[entries], ranks)
+  sub.num_vars = vig.num_vars
+  sub.nodes = np.flatnonzero(nodes)
+  return sub
+
+# occurrences of each variable in the standard clauses
+def clause_occurrences (formula):
+  lits, offsets, _, kinds = formula.as_numpy()
+  in_clause = np.repeat(kinds, np.diff(offsets)) == CLAUSE
+  return np.bincount(np.abs(lits[in_clause]), minlength=formula.max_var + 1)
+
+
+# Cache key of a graph (or of its communities), params are the graph and Louvain parameters
+def cache_key (formula, kind, **params):
+  h = hashlib.sha256()
+  h.update(formula.digest(ignore_bounds=True).encode())
+  h.update(kind.encode())
+  h.update(repr(sorted(params.items())).encode())
+  h.update(str(VIG_CACHE_VERSION).encode())
+  return h.hexdigest()
+
+# Write the arrays to path atomically, with the key they were computed for
+def save_npz (path, key, **arrays):
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+  with os.fdopen(fd, 'wb') as f:
+    np.savez(f, key=np.array(key), **arrays)
+  os.chmod(tmp_path, 0o644)
+  os.replace(tmp_path, path)
+
+# Arrays stored in path, None when missing, unreadable or computed for another key
+def load_npz (path, key):
+  if path is None or not os.path.exists(path):
+    return None
+  try:
+    with np.load(path) as data:
+      if str(data["key"]) != key:
+        return None
+      arrays = {name: data[name] for name in data.files}
+  except (OSError, ValueError, KeyError):
+    return None
+
+  # refresh the entry for the LRU eviction of the ordering cache
+  try:
+    os.utime(path)
+  except OSError:
+    pass
+  return arrays
+
+def save_vig (vig, path, key):
+  save_npz(path, key, num_nodes=vig.num_nodes, num_vars=vig.num_vars, indptr=vig.indptr,
+           indices=vig.indices, weights=vig.weights, ranks=vig.ranks)
+
+def load_vig (path, key):
+  data = load_npz(path, key)
+  if data is None:
+    return None
+  vig = VIG(int(data["num_nodes"]), data["indptr"], data["indices"], data["weights"], data["ranks"])
+  vig.num_vars = int(data["num_vars"])
+  return vig
+
+# Partitions (lists of sorted groups, sorted) as one row of community labels per partition
+def save_partitions (partitions, num_nodes, path, key):
+  labels = np.full((len(partitions), num_nodes + 1), -1, dtype=np.int32)
+  for row, groups in enumerate(partitions):
+    for label, group in enumerate(groups):
+      labels[row, group] = label
+  save_npz(path, key, labels=labels)
+
+def load_partitions (path, key):
+  data = load_npz(path, key)
+  if data is None:
+    return None
+
+  partitions = []
+  for labels in data["labels"]:
+    nodes = np.flatnonzero(labels >= 0)
+    nodes = nodes[np.argsort(labels[nodes], kind='stable')]
+    splits = np.flatnonzero(np.diff(labels[nodes])) + 1
+    partitions.append(sorted(group.tolist() for group in np.split(nodes, splits)))
+  return partitions